@@ -0,0 +1,165 @@
+import asyncio
+import os
+from typing import Dict, Iterable, List, Tuple
+
+from sortedcontainers import SortedList
+
+# Upper bound on indexed terms across every library; entities beyond it are simply not suggested
+MAX_TERMS = int(os.environ.get('AUTOCOMPLETE_MAX_TERMS', 1_000_000))
+# Entities indexed per step of a bulk update before other requests get a turn
+INDEX_SLICE = 100
+
+# Which fields feed the index for each entity type, keyed by collection name
+INDEXED_FIELDS = {
+    'books': ('book', ['title', 'author']),
+    'magazines': ('magazine', ['title', 'author']),
+    'students': ('student', ['name']),
+    'teachers': ('teacher', ['name']),
+}
+
+def terms_for(texts: Iterable[str]) -> List[str]:
+    """Every word-boundary suffix of each text, lowercased.
+
+    "Clean Code" yields "clean code" and "code", so typing either word's
+    prefix finds the entity.
+    """
+    terms = set()
+    for text in texts:
+        words = (text or '').lower().split()
+        for i in range(len(words)):
+            terms.add(' '.join(words[i:]))
+    return sorted(terms)
+
+class TermBudget:
+    """Term count shared by every library's index, capped at max_terms"""
+
+    def __init__(self, max_terms: int):
+        self.max_terms = max_terms
+        self.used = 0
+
+budget = TermBudget(MAX_TERMS)
+
+class PrefixIndex:
+    """Sorted prefix index for type-ahead.
+
+    Terms live in one SortedList of (term, entity_id) tuples, which keeps
+    them in small sorted blocks: adding or removing a term is a binary search
+    plus a short in-block shift, never a sort or copy of the whole index, so
+    bulk writes stay cheap however large it grows. A lookup is a binary
+    search to the first term >= prefix followed by a short forward walk, so
+    its cost depends on the result limit rather than index size. Labels are
+    stored once per entity, not once per term.
+    """
+
+    def __init__(self, term_budget: TermBudget = budget):
+        self.budget = term_budget
+        self._entries = SortedList()
+        # Terms are kept as tuples so these entries hold no mutable objects and the garbage collector skips them
+        self._entities: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {}
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _terms_to_add(self, entity_id: str, kind: str, label: str, texts: Iterable[str]) -> Tuple[str, ...]:
+        """Register an entity and return the terms it needs indexed (none if unchanged or over budget)"""
+        terms = tuple(terms_for(texts))
+        current = self._entities.get(entity_id)
+        if current is not None and current[2] == terms:
+            self._entities[entity_id] = (kind, label, terms)
+            return ()
+        self.remove(entity_id)
+        if self.budget.used + len(terms) > self.budget.max_terms:
+            self.dropped += 1
+            return ()
+        self.budget.used += len(terms)
+        self._entities[entity_id] = (kind, label, terms)
+        return terms
+
+    def add(self, entity_id: str, kind: str, label: str, texts: Iterable[str]):
+        """Index (or re-index) a single entity"""
+        for term in self._terms_to_add(entity_id, kind, label, texts):
+            self._entries.add((term, entity_id))
+
+    def add_many(self, entities: Iterable[Tuple[str, str, str, Iterable[str]]]):
+        """Index (or re-index) many entities"""
+        entries = []
+        for entity_id, kind, label, texts in {entity[0]: entity for entity in entities}.values():
+            entries.extend((term, entity_id) for term in self._terms_to_add(entity_id, kind, label, texts))
+        self._entries.update(entries)
+
+    def remove(self, entity_id: str):
+        """Drop an entity and all of its terms"""
+        entity = self._entities.pop(entity_id, None)
+        if entity is None:
+            return
+        for term in entity[2]:
+            self._entries.discard((term, entity_id))
+        self.budget.used -= len(entity[2])
+
+    def release(self):
+        """Give this index's terms back to the budget before it is thrown away"""
+        self.budget.used -= len(self._entries)
+        self._entries.clear()
+        self._entities.clear()
+
+    def search(self, prefix: str, limit: int = 10) -> List[Dict]:
+        """Distinct entities having a term that starts with prefix, in term order"""
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        for term, entity_id in self._entries.irange((prefix,)):
+            if not term.startswith(prefix) or len(results) >= limit:
+                break
+            if entity_id not in seen:
+                seen.add(entity_id)
+                kind, label, _ = self._entities[entity_id]
+                results.append({"id": entity_id, "type": kind, "label": label})
+        return results
+
+# One index per library, filled at startup by build_index
+indexes: Dict[str, PrefixIndex] = {}
+
+def get_index(library_id: str) -> PrefixIndex:
+    if library_id not in indexes:
+        indexes[library_id] = PrefixIndex()
+    return indexes[library_id]
+
+def entity_entry(collection_name: str, doc: Dict) -> Tuple[str, str, str, List[str]]:
+    """The (id, type, label, texts) tuple PrefixIndex expects for a stored document"""
+    kind, fields = INDEXED_FIELDS[collection_name]
+    texts = [doc.get(field, '') for field in fields]
+    return doc['id'], kind, texts[0], texts
+
+def index_document(library_id: str, collection_name: str, doc: Dict):
+    """Add or refresh one document after a write"""
+    if collection_name in INDEXED_FIELDS:
+        get_index(library_id).add(*entity_entry(collection_name, doc))
+
+async def index_documents(library_id: str, collection_name: str, docs: Iterable[Dict]):
+    """Add or refresh a batch of documents after a bulk write, yielding to the event loop between slices"""
+    if collection_name not in INDEXED_FIELDS:
+        return
+    index = get_index(library_id)
+    entries = [entity_entry(collection_name, doc) for doc in docs]
+    for start in range(0, len(entries), INDEX_SLICE):
+        index.add_many(entries[start:start + INDEX_SLICE])
+        await asyncio.sleep(0)
+
+def unindex_document(library_id: str, entity_id: str):
+    """Forget a deleted document"""
+    get_index(library_id).remove(entity_id)
+
+async def build_index(library_id: str, collections: Dict):
+    """Rebuild a library's index from its collections"""
+    previous = indexes.pop(library_id, None)
+    if previous is not None:
+        previous.release()
+    index = PrefixIndex()
+    for collection_name, (_, fields) in INDEXED_FIELDS.items():
+        projection = {'_id': 0, 'id': 1, **{field: 1 for field in fields}}
+        entries = [entity_entry(collection_name, doc) async for doc in collections[collection_name].find({}, projection)]
+        index.add_many(entries)
+    indexes[library_id] = index
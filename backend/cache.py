@@ -0,0 +1,79 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+# Most single-entity documents kept in memory, and how long one may be served before it is reread
+ENTITY_CACHE_SIZE = int(os.environ.get('ENTITY_CACHE_SIZE', 10_000))
+ENTITY_CACHE_TTL = float(os.environ.get('ENTITY_CACHE_TTL', 60))
+
+Key = Tuple[str, str, str]
+
+class EntityCache:
+    """Read-through LRU cache of whole documents keyed by (library_id, collection, id), with a TTL.
+
+    Writers call invalidate() for the ids they touched. A reader takes a
+    token() before going to Mongo and passes it to put(), which drops the
+    document if anything was invalidated in between, so a slow read can
+    never cache a value older than a concurrent write.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Key, Tuple[float, Dict]]" = OrderedDict()
+        self._invalidations = 0
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, library_id: str, collection_name: str, entity_id: str) -> Optional[Dict]:
+        key = (library_id, collection_name, entity_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.metrics["misses"] += 1
+            return None
+        expires, doc = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            self.metrics["expirations"] += 1
+            self.metrics["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.metrics["hits"] += 1
+        return doc
+
+    def token(self) -> int:
+        return self._invalidations
+
+    def put(self, library_id: str, collection_name: str, entity_id: str, doc: Dict, token: int):
+        if token != self._invalidations or self.max_entries <= 0:
+            return
+        key = (library_id, collection_name, entity_id)
+        self._entries[key] = (time.monotonic() + self.ttl, doc)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def invalidate(self, library_id: str, collection_name: str, entity_ids: Iterable[str]):
+        self._invalidations += 1
+        for entity_id in entity_ids:
+            if self._entries.pop((library_id, collection_name, entity_id), None) is not None:
+                self.metrics["invalidations"] += 1
+
+    def invalidate_collection(self, library_id: str, collection_name: str):
+        """For writes that touch a whole collection at once"""
+        self.invalidate(library_id, collection_name, [
+            entity_id for library, name, entity_id in self._entries if (library, name) == (library_id, collection_name)
+        ])
+
+    def stats(self) -> Dict:
+        lookups = self.metrics["hits"] + self.metrics["misses"]
+        return {
+            **self.metrics,
+            "hit_rate": round(self.metrics["hits"] / lookups, 4) if lookups else None,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+        }
+
+entity_cache = EntityCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
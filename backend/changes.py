@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+from database import LazyCollection, get_collections
+
+# {'_id': 'modified', 'value': n, 'pending': [{'id': ..., 'stamp': n, 'at': ...}]}: the last
+# modification stamp handed out, bumped with $inc, and the stamps whose write has not finished
+counters = LazyCollection('counters')
+# Highest source stamp already copied per pair: {'_id': 'a:b', 'modified': n, 'synced_at': ...}
+sync_watermarks = LazyCollection('sync_watermarks')
+
+# Left out of content_hash: bookkeeping, plus 'available', which borrow and return
+# flip in place without rewriting the rest of the document
+UNHASHED_FIELDS = {'_id', 'modified', 'content_hash', 'active_borrows', 'available'}
+
+# Seconds after which a pending stamp is taken to belong to a process that died mid-write
+STAMP_LEASE_TIMEOUT = int(os.environ.get('STAMP_LEASE_TIMEOUT', 300))
+
+def content_hash(doc: Dict) -> str:
+    """Stable digest of a document's content, independent of key order"""
+    content = {key: value for key, value in doc.items() if key not in UNHASHED_FIELDS}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def is_unchanged(record: Dict, stored: Optional[Dict]) -> bool:
+    """Whether writing record over the stored document (content_hash and available) would change nothing"""
+    return (stored is not None and stored.get('content_hash') == record['content_hash']
+            and stored.get('available') == record.get('available'))
+
+@asynccontextmanager
+async def change_stamp():
+    """Reserve the next modification stamp for one write and yield it.
+
+    Keep the write inside the block: settled_stamp() will not move past a
+    stamp until the block holding it has exited. The reservation is kept on
+    the counters document, so this holds across every process sharing the
+    database.
+    """
+    allocation = str(uuid.uuid4())
+    try:
+        # The lease is pushed in the same update as the $inc; its stamp is only known once it returns
+        counter = await counters.find_one_and_update(
+            {'_id': 'modified'},
+            {'$inc': {'value': 1}, '$push': {'pending': {'id': allocation, 'at': datetime.now().isoformat()}}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        stamp = counter['value']
+        await counters.update_one({'_id': 'modified', 'pending.id': allocation}, {'$set': {'pending.$.stamp': stamp}})
+        yield stamp
+    finally:
+        await counters.update_one({'_id': 'modified'}, {'$pull': {'pending': {'id': allocation}}})
+
+async def settled_stamp() -> int:
+    """Highest stamp at or below which every write has finished.
+
+    Changes with a stamp above the returned value may still be in flight, so
+    a sync that reads everything up to now can safely store it as its
+    watermark. Leases older than STAMP_LEASE_TIMEOUT are dropped as left by
+    a process that died mid-write.
+    """
+    cutoff = (datetime.now() - timedelta(seconds=STAMP_LEASE_TIMEOUT)).isoformat()
+    await counters.update_one({'_id': 'modified'}, {'$pull': {'pending': {'at': {'$lt': cutoff}}}})
+    counter = await counters.find_one({'_id': 'modified'})
+    current = counter['value'] if counter else 0
+    leases = counter.get('pending', []) if counter else []
+    # Wait out leases whose stamp is not recorded yet; it may be <= current
+    unknown = {lease['id'] for lease in leases if 'stamp' not in lease}
+    while unknown:
+        await asyncio.sleep(0.001)
+        counter = await counters.find_one({'_id': 'modified'})
+        leases = counter.get('pending', [])
+        unknown &= {lease['id'] for lease in leases if 'stamp' not in lease}
+    pending = [lease['stamp'] for lease in leases if 'stamp' in lease and lease['stamp'] <= current]
+    return min(pending) - 1 if pending else current
+
+async def record_deletions(library_id: str, collection_name: str, entity_ids: Iterable[str]):
+    """Leave a stamped tombstone per deleted id so syncs can propagate the delete"""
+    entity_ids = list(entity_ids)
+    if not entity_ids:
+        return
+    collections = await get_collections(library_id)
+    async with change_stamp() as stamp:
+        await collections['tombstones'].bulk_write([
+            UpdateOne({'id': entity_id}, {'$set': {'collection': collection_name, 'modified': stamp}}, upsert=True)
+            for entity_id in entity_ids
+        ], ordered=False)
+
+async def get_watermark(source_library: str, target_library: str) -> int:
+    """Stamp the last successful sync from source to target got up to, 0 if never synced"""
+    doc = await sync_watermarks.find_one({'_id': f'{source_library}:{target_library}'})
+    return doc['modified'] if doc else 0
+
+async def set_watermark(source_library: str, target_library: str, stamp: int):
+    await sync_watermarks.update_one(
+        {'_id': f'{source_library}:{target_library}'},
+        {'$set': {'modified': stamp, 'synced_at': datetime.now().isoformat()}},
+        upsert=True
+    )
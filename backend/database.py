@@ -1,45 +1,242 @@
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import ASCENDING, TEXT
+from scoped import ScopedCollection
+from datetime import datetime
+from typing import Dict, List, Optional
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
 
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
+DB_NAME = 'library_management'
 
-client = MongoClient(MONGO_URL)
-db = client.library_management
-
-# Collections for Library A
-library_a_students = db.library_a_students
-library_a_teachers = db.library_a_teachers
-library_a_books = db.library_a_books
-library_a_magazines = db.library_a_magazines
-library_a_borrow_records = db.library_a_borrow_records
-
-# Collections for Library B
-library_b_students = db.library_b_students
-library_b_teachers = db.library_b_teachers
-library_b_books = db.library_b_books
-library_b_magazines = db.library_b_magazines
-library_b_borrow_records = db.library_b_borrow_records
-
-def get_collections(library_id: str):
-    """Get collections for a specific library"""
-    if library_id == 'a':
-        return {
-            'students': library_a_students,
-            'teachers': library_a_teachers,
-            'books': library_a_books,
-            'magazines': library_a_magazines,
-            'borrow_records': library_a_borrow_records
-        }
-    elif library_id == 'b':
-        return {
-            'students': library_b_students,
-            'teachers': library_b_teachers,
-            'books': library_b_books,
-            'magazines': library_b_magazines,
-            'borrow_records': library_b_borrow_records
-        }
-    else:
-        raise ValueError(f"Invalid library_id: {library_id}")
\ No newline at end of file
+# MongoClient option -> (environment variable, type); unset variables keep the driver default
+CLIENT_SETTINGS = {
+    'maxPoolSize': ('MONGO_MAX_POOL_SIZE', int),
+    'minPoolSize': ('MONGO_MIN_POOL_SIZE', int),
+    'maxIdleTimeMS': ('MONGO_MAX_IDLE_TIME_MS', int),
+    'waitQueueTimeoutMS': ('MONGO_WAIT_QUEUE_TIMEOUT_MS', int),
+    'connectTimeoutMS': ('MONGO_CONNECT_TIMEOUT_MS', int),
+    'socketTimeoutMS': ('MONGO_SOCKET_TIMEOUT_MS', int),
+    'serverSelectionTimeoutMS': ('MONGO_SERVER_SELECTION_TIMEOUT_MS', int),
+    # e.g. "zstd,snappy,zlib"; zstd and snappy need the zstandard / python-snappy packages
+    'compressors': ('MONGO_COMPRESSORS', str),
+}
+
+def client_options() -> Dict:
+    options = {}
+    for option, (variable, cast) in CLIENT_SETTINGS.items():
+        value = os.environ.get(variable)
+        if value:
+            options[option] = cast(value)
+    return options
+
+# Created by connect() from the app lifespan, so importing this module opens nothing
+_client: Optional[AsyncIOMotorClient] = None
+
+def connect() -> AsyncIOMotorDatabase:
+    """Create the Mongo client if it does not exist yet and return the database"""
+    global _client
+    if _client is None:
+        # Motor keeps every Mongo round trip on the event loop instead of blocking it
+        _client = AsyncIOMotorClient(MONGO_URL, **client_options())
+    return _client[DB_NAME]
+
+def close():
+    """Close the client and drop every handle bound to it"""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+    _bundles.clear()
+
+def get_db() -> AsyncIOMotorDatabase:
+    if _client is None:
+        raise RuntimeError("MongoDB client is not connected; call database.connect() first")
+    return _client[DB_NAME]
+
+class LazyCollection:
+    """A module-level collection handle that binds to the client on each use"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attribute):
+        return getattr(get_db()[self.name], attribute)
+
+# One document per library ({'_id': library_id, 'name': ...}); the source of truth for which libraries exist
+libraries = LazyCollection('libraries')
+
+# {'_id': 'storage', 'layout': ..., 'started_at': ...}: the layout the server last started with
+server_state = LazyCollection('server_state')
+
+# Libraries registered on first start, so existing data keeps working
+DEFAULT_LIBRARIES = {'a': 'Library A', 'b': 'Library B'}
+
+# Library ids become part of collection names, so keep them short and plain
+LIBRARY_ID_PATTERN = re.compile(r'^[a-z0-9_]{1,32}$')
+
+# Every library has one collection of each of these, named library_<id>_<name>
+COLLECTION_NAMES = ['students', 'teachers', 'books', 'magazines', 'borrow_records', 'registry', 'tombstones']
+
+# 'per_library': one set of collections per library (library_a_books, ...)
+# 'shared': one collection per entity type for all libraries (shared_books, ...), keyed by library_id
+STORAGE_LAYOUTS = ['per_library', 'shared']
+STORAGE_LAYOUT = os.environ.get('STORAGE_LAYOUT', 'per_library')
+if STORAGE_LAYOUT not in STORAGE_LAYOUTS:
+    raise ValueError(f"STORAGE_LAYOUT must be one of {', '.join(STORAGE_LAYOUTS)}, not {STORAGE_LAYOUT!r}")
+
+# Indexes every library's collections must carry, keyed by collection name
+INDEX_MANIFEST = {
+    'students': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+        {'keys': [('name', TEXT)]},
+        {'keys': [('modified', ASCENDING)]},
+    ],
+    'teachers': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+        {'keys': [('name', TEXT)]},
+        {'keys': [('modified', ASCENDING)]},
+    ],
+    'books': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+        {'keys': [('available', ASCENDING)]},
+        {'keys': [('title', TEXT), ('author', TEXT)], 'weights': {'title': 3, 'author': 1}},
+        {'keys': [('modified', ASCENDING)]},
+    ],
+    'magazines': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+        {'keys': [('available', ASCENDING)]},
+        {'keys': [('title', TEXT), ('author', TEXT)], 'weights': {'title': 3, 'author': 1}},
+        {'keys': [('modified', ASCENDING)]},
+    ],
+    'borrow_records': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+        {'keys': [('person_id', ASCENDING), ('status', ASCENDING)]},
+        {'keys': [('status', ASCENDING), ('due_date', ASCENDING)]},
+        # Only set while an overdue sweep is in flight, so this stays tiny
+        {'keys': [('overdue_sweep', ASCENDING)], 'sparse': True},
+    ],
+    'registry': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+    ],
+    # One per deleted entity id, read by delta syncs
+    'tombstones': [
+        {'keys': [('id', ASCENDING)], 'unique': True},
+        {'keys': [('modified', ASCENDING)]},
+    ],
+}
+
+def shared_index_manifest() -> Dict[str, List[Dict]]:
+    """INDEX_MANIFEST for the shared layout: every index led by library_id.
+
+    Uniqueness becomes per library, and (library_id, _id) backs keyset
+    pagination. Sparse indexes stay as they are, since a library_id prefix
+    would make every document part of them.
+    """
+    manifest = {}
+    for name, specs in INDEX_MANIFEST.items():
+        manifest[name] = [{'keys': [('library_id', ASCENDING), ('_id', ASCENDING)]}]
+        for spec in specs:
+            if spec.get('sparse'):
+                manifest[name].append(spec)
+            else:
+                manifest[name].append({**spec, 'keys': [('library_id', ASCENDING)] + spec['keys']})
+    return manifest
+
+class LibraryNotFound(ValueError):
+    """No library is registered under the requested id"""
+
+# library_id -> {collection name: collection handle}, filled on first use
+_bundles: Dict[str, Dict] = {}
+
+def per_library_bundle(library_id: str) -> Dict[str, AsyncIOMotorCollection]:
+    return {name: get_db()[f'library_{library_id}_{name}'] for name in COLLECTION_NAMES}
+
+def shared_collection(name: str) -> AsyncIOMotorCollection:
+    return get_db()[f'shared_{name}']
+
+def collection_bundle(library_id: str) -> Dict:
+    """Collection handles for a library in the configured storage layout"""
+    if STORAGE_LAYOUT == 'shared':
+        return {name: ScopedCollection(shared_collection(name), library_id) for name in COLLECTION_NAMES}
+    return per_library_bundle(library_id)
+
+async def get_collections(library_id: str) -> Dict:
+    """Get collections for a specific library.
+
+    A dict lookup once the library has been seen; the first request for a
+    library checks the registry and caches its handles. Raises
+    LibraryNotFound for unregistered ids.
+    """
+    bundle = _bundles.get(library_id)
+    if bundle is None:
+        if not await libraries.find_one({'_id': library_id}, {'_id': 1}):
+            raise LibraryNotFound(f"Invalid library_id: {library_id}")
+        bundle = _bundles.setdefault(library_id, collection_bundle(library_id))
+    return bundle
+
+async def list_libraries() -> List[Dict]:
+    """Every registered library, in id order"""
+    return await libraries.find({}).sort('_id', 1).to_list(length=None)
+
+async def library_ids() -> List[str]:
+    return [library['_id'] for library in await list_libraries()]
+
+async def register_library(library_id: str, name: str) -> bool:
+    """Add a library to the registry; False if the id is already taken"""
+    if not LIBRARY_ID_PATTERN.match(library_id):
+        raise ValueError("Library ids may only use a-z, 0-9 and _ (at most 32 characters)")
+    result = await libraries.update_one(
+        {'_id': library_id},
+        {'$setOnInsert': {'name': name, 'created_at': datetime.now().isoformat()}},
+        upsert=True
+    )
+    return result.upserted_id is not None
+
+async def ensure_default_libraries():
+    """Register the built-in libraries the first time the server starts"""
+    for library_id, name in DEFAULT_LIBRARIES.items():
+        await register_library(library_id, name)
+
+async def record_storage_layout():
+    """Note which layout is being served, so migrate_storage.py can refuse to run once it is 'shared'"""
+    await server_state.update_one(
+        {'_id': 'storage'},
+        {'$set': {'layout': STORAGE_LAYOUT, 'started_at': datetime.now().isoformat()}},
+        upsert=True
+    )
+
+async def served_storage_layout() -> str:
+    state = await server_state.find_one({'_id': 'storage'})
+    return state['layout'] if state else 'per_library'
+
+async def ensure_indexes(library_id: str):
+    """Create any missing manifest indexes for a library (safe to run repeatedly)"""
+    collections = await get_collections(library_id)
+    manifest = shared_index_manifest() if STORAGE_LAYOUT == 'shared' else INDEX_MANIFEST
+    for name, indexes in manifest.items():
+        for spec in indexes:
+            options = {key: value for key, value in spec.items() if key != 'keys'}
+            await collections[name].create_index(spec['keys'], **options)
+
+async def get_index_stats(library_id: str):
+    """Per-collection index usage counters as reported by $indexStats"""
+    collections = await get_collections(library_id)
+    stats = {}
+    for name in INDEX_MANIFEST:
+        # $indexStats must run on the whole collection, which in the shared layout spans every library
+        collection = getattr(collections[name], 'raw', collections[name])
+        cursor = collection.aggregate([{'$indexStats': {}}])
+        stats[name] = [
+            {
+                'name': entry['name'],
+                'key': dict(entry['key']),
+                'ops': entry['accesses']['ops'],
+                'since': entry['accesses']['since'].isoformat(),
+            }
+            async for entry in cursor
+        ]
+    return stats
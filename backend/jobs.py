@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, BinaryIO, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from starlette.concurrency import run_in_threadpool
+
+from database import LazyCollection
+
+logger = logging.getLogger(__name__)
+
+# One document per job ({'_id': job_id, ...}); status and resume checkpoints live here
+jobs = LazyCollection('jobs')
+
+# Background workers, i.e. how many jobs run at once
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# A running job whose heartbeat is older than this (seconds) is taken to have lost its worker
+JOB_HEARTBEAT_TIMEOUT = int(os.environ.get('JOB_HEARTBEAT_TIMEOUT', 120))
+# Uploaded files wait here until their job finishes, so a restart can resume them
+JOB_SPOOL_DIR = os.environ.get('JOB_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'lms_jobs'))
+
+FINISHED_STATUSES = ['completed', 'failed', 'cancelled']
+
+# Owner recorded on the jobs this process claims
+WORKER_ID = str(uuid.uuid4())
+
+class JobCancelled(Exception):
+    """Raised from Job.commit once cancellation has been requested"""
+
+class JobLost(Exception):
+    """Raised from Job.commit when the job was requeued and claimed by another worker"""
+
+class Job:
+    """A running job as its handler sees it: parameters, last checkpoint and commit()"""
+
+    def __init__(self, doc: Dict):
+        self.id = doc['_id']
+        self.type = doc['type']
+        self.params = doc['params']
+        self.checkpoint = doc.get('checkpoint') or {}
+
+    async def commit(self, checkpoint: Dict, processed: int, progress: Optional[float] = None):
+        """Record a durably written batch.
+
+        `checkpoint` is whatever the handler needs to carry on after it
+        following a restart; `progress` is the completed fraction, when the
+        handler can tell. Also refreshes the claim's heartbeat. Raises
+        JobCancelled if the job was cancelled and JobLost if this worker no
+        longer owns it.
+        """
+        self.checkpoint = checkpoint
+        doc = await jobs.find_one_and_update(
+            {'_id': self.id, 'worker_id': WORKER_ID},
+            {'$set': {
+                'checkpoint': checkpoint,
+                'processed': processed,
+                'progress': progress,
+                'heartbeat_at': datetime.now().isoformat(),
+            }},
+            projection={'cancel_requested': 1}
+        )
+        if doc is None:
+            raise JobLost()
+        if doc.get('cancel_requested'):
+            raise JobCancelled()
+
+# job type -> async handler(job) returning the job's result
+JOB_HANDLERS: Dict[str, Callable[[Job], Awaitable[Dict]]] = {}
+
+def job_handler(job_type: str):
+    """Register the coroutine that runs jobs of one type"""
+    def register(handler):
+        JOB_HANDLERS[job_type] = handler
+        return handler
+    return register
+
+_queue: Optional[asyncio.Queue] = None
+
+def spool_path(job_id: str) -> str:
+    return os.path.join(JOB_SPOOL_DIR, job_id)
+
+def _copy_to_spool(fileobj: BinaryIO, path: str):
+    os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+    with open(path, 'wb') as spool:
+        shutil.copyfileobj(fileobj, spool)
+
+def _remove_spool(job_id: str):
+    try:
+        os.remove(spool_path(job_id))
+    except FileNotFoundError:
+        pass
+
+async def submit_job(job_type: str, params: Dict, upload: Optional[BinaryIO] = None) -> Dict:
+    """Persist a new job and queue it; an upload is first copied to the spool directory"""
+    job_id = str(uuid.uuid4())
+    if upload is not None:
+        await run_in_threadpool(_copy_to_spool, upload, spool_path(job_id))
+        params = {**params, 'path': spool_path(job_id)}
+    doc = {
+        '_id': job_id,
+        'type': job_type,
+        'status': 'queued',
+        'params': params,
+        'checkpoint': {},
+        'processed': 0,
+        'progress': None,
+        'created_at': datetime.now().isoformat(),
+    }
+    await jobs.insert_one(doc)
+    _queue.put_nowait(job_id)
+    return doc
+
+async def cancel_job(job_id: str) -> Optional[Dict]:
+    """Cancel a queued job outright or flag a running one to stop at its next commit"""
+    now = datetime.now().isoformat()
+    doc = await jobs.find_one_and_update(
+        {'_id': job_id, 'status': 'queued'},
+        {'$set': {'status': 'cancelled', 'cancel_requested': True, 'finished_at': now}},
+        return_document=ReturnDocument.AFTER
+    )
+    if doc:
+        _remove_spool(job_id)
+        return doc
+    return await jobs.find_one_and_update(
+        {'_id': job_id, 'status': {'$nin': FINISHED_STATUSES}},
+        {'$set': {'cancel_requested': True}},
+        return_document=ReturnDocument.AFTER
+    ) or await jobs.find_one({'_id': job_id})
+
+def describe_job(doc: Dict) -> Dict:
+    """Public view of a job document with its current rate (records/s) and ETA (s)"""
+    view = {key: value for key, value in doc.items() if key not in ('_id', 'checkpoint')}
+    view['id'] = doc['_id']
+    view['params'] = {key: value for key, value in doc['params'].items() if key != 'path'}
+
+    rate = eta = None
+    if doc.get('run_started_at'):
+        end = datetime.fromisoformat(doc['finished_at']) if doc.get('finished_at') else datetime.now()
+        elapsed = (end - datetime.fromisoformat(doc['run_started_at'])).total_seconds()
+        done = doc['processed'] - doc.get('run_processed_start', 0)
+        if elapsed > 0:
+            rate = round(done / elapsed, 1)
+        progress = doc.get('progress')
+        if doc['status'] == 'running' and rate and progress:
+            eta = round((doc['processed'] / progress - doc['processed']) / rate, 1)
+    view['rate'] = rate
+    view['eta_seconds'] = eta
+    return view
+
+async def _run(job_id: str):
+    """Claim a queued job and drive its handler to a final status"""
+    doc = await jobs.find_one({'_id': job_id, 'status': 'queued'})
+    if doc is None:
+        return
+    now = datetime.now().isoformat()
+    doc = await jobs.find_one_and_update({'_id': job_id, 'status': 'queued'}, {'$set': {
+        'status': 'running',
+        'worker_id': WORKER_ID,
+        'heartbeat_at': now,
+        'started_at': doc.get('started_at') or now,
+        'run_started_at': now,
+        'run_processed_start': doc['processed'],
+    }}, return_document=ReturnDocument.AFTER)
+    if doc is None:
+        return
+
+    update = {}
+    try:
+        if doc.get('cancel_requested'):
+            raise JobCancelled()
+        result = await JOB_HANDLERS[doc['type']](Job(doc))
+        update = {'status': 'completed', 'result': result, 'progress': 1.0}
+    except JobCancelled:
+        update = {'status': 'cancelled'}
+    except JobLost:
+        # Requeued after a missed heartbeat; the worker that holds it now finishes it
+        logger.warning("Job %s was taken over by another worker", job_id)
+        return
+    except asyncio.CancelledError:
+        # Shutting down: hand the job back so the next worker to start resumes it from its checkpoint
+        await jobs.update_one({'_id': job_id, 'worker_id': WORKER_ID}, {'$set': {'status': 'queued'}, '$unset': {'worker_id': ''}})
+        raise
+    except Exception as e:
+        logger.exception("Job %s failed", job_id)
+        update = {'status': 'failed', 'error': str(e)}
+    update['finished_at'] = datetime.now().isoformat()
+    written = await jobs.update_one({'_id': job_id, 'worker_id': WORKER_ID}, {'$set': update})
+    if written.matched_count:
+        _remove_spool(job_id)
+
+async def _worker():
+    while True:
+        job_id = await _queue.get()
+        try:
+            await _run(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Job worker crashed on %s", job_id)
+
+async def requeue_stale_jobs() -> List[str]:
+    """Put back to 'queued' the running jobs whose worker stopped sending heartbeats.
+
+    Jobs claimed by live workers, in this process or another one sharing
+    the database, keep their claim. Returns the ids of the requeued jobs.
+    """
+    cutoff = (datetime.now() - timedelta(seconds=JOB_HEARTBEAT_TIMEOUT)).isoformat()
+    stale = {'status': 'running', '$or': [
+        {'heartbeat_at': {'$lt': cutoff}},
+        {'heartbeat_at': {'$exists': False}},
+    ]}
+    requeued = []
+    async for doc in jobs.find(stale, {'_id': 1}):
+        # Requeue only if no worker refreshed the claim in the meantime
+        if await jobs.find_one_and_update({'_id': doc['_id'], **stale}, {'$set': {'status': 'queued'}, '$unset': {'worker_id': ''}}):
+            requeued.append(doc['_id'])
+    return requeued
+
+async def _watch_heartbeats():
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_TIMEOUT)
+        try:
+            requeued = await requeue_stale_jobs()
+            for job_id in requeued:
+                _queue.put_nowait(job_id)
+            if requeued:
+                logger.warning("Requeued %d job(s) with a stale heartbeat", len(requeued))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Job heartbeat check failed")
+
+async def start_job_workers() -> List[asyncio.Task]:
+    """Requeue jobs whose worker died, queue waiting jobs and start the worker pool"""
+    global _queue
+    _queue = asyncio.Queue()
+    await jobs.create_index('status')
+    await requeue_stale_jobs()
+    async for doc in jobs.find({'status': 'queued'}, {'_id': 1}).sort('created_at', 1):
+        _queue.put_nowait(doc['_id'])
+    workers = [asyncio.create_task(_worker()) for _ in range(JOB_WORKERS)]
+    return workers + [asyncio.create_task(_watch_heartbeats())]
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Copy libraries from the per-library layout (library_<id>_<name>) into the
+shared layout (shared_<name>, keyed by library_id).
+
+The copy is keyed by _id and idempotent, so the bulk of it can run while the
+server keeps serving from the per-library collections:
+
+    python migrate_storage.py                   # bulk copy, prints a --since stamp
+    python migrate_storage.py --since <stamp>   # catch up, as often as needed
+    # stop the server, so nothing is written during the last step
+    python migrate_storage.py --since <stamp>   # final catch-up with writes frozen
+    # start the server with STORAGE_LAYOUT=shared
+
+A --since run only recopies entities and tombstones stamped after <stamp>.
+Borrow records and the registry carry no stamps and are always recopied, as
+is every person's active_borrows counter, which borrows and returns change
+without restamping. It then removes from the shared collections whatever no
+longer exists in the per-library ones, which mirrors the per-library data
+exactly and is only safe while nothing is served from the shared layout.
+So once a server has started with STORAGE_LAYOUT=shared, this tool refuses
+to run: from then on the shared collections are the source of truth.
+
+The per-library collections are left in place; drop them once the shared
+layout has been checked.
+"""
+
+import argparse
+import asyncio
+import sys
+from typing import Optional
+
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+
+from changes import counters
+from database import (
+    COLLECTION_NAMES, INDEX_MANIFEST, close, connect, library_ids, per_library_bundle, served_storage_layout,
+    shared_collection, shared_index_manifest
+)
+
+# Collections whose documents carry a 'modified' stamp
+STAMPED_COLLECTIONS = [name for name in COLLECTION_NAMES if name not in ('borrow_records', 'registry')]
+
+async def current_stamp() -> int:
+    counter = await counters.find_one({'_id': 'modified'})
+    return counter['value'] if counter else 0
+
+async def ensure_shared_indexes():
+    for name, indexes in shared_index_manifest().items():
+        for spec in indexes:
+            options = {key: value for key, value in spec.items() if key != 'keys'}
+            await shared_collection(name).create_index(spec['keys'], **options)
+
+async def copy_collection(library_id: str, name: str, batch_size: int, since: Optional[int]) -> int:
+    """Upsert one library's documents into shared_<name>, a keyset page at a time"""
+    source = per_library_bundle(library_id)[name]
+    target = shared_collection(name)
+    query = {'modified': {'$gt': since}} if since is not None and name in STAMPED_COLLECTIONS else {}
+    copied = 0
+    last_id = None
+    while True:
+        page_query = {**query, '_id': {'$gt': last_id}} if last_id is not None else query
+        docs = await source.find(page_query).sort('_id', 1).limit(batch_size).to_list(length=batch_size)
+        if not docs:
+            return copied
+        await target.bulk_write([
+            ReplaceOne({'_id': doc['_id']}, {**doc, 'library_id': library_id}, upsert=True) for doc in docs
+        ], ordered=False)
+        copied += len(docs)
+        last_id = docs[-1]['_id']
+
+async def copy_loan_counters(library_id: str, name: str, batch_size: int):
+    """Bring every person's active_borrows across; borrows and returns $inc it without a new stamp"""
+    source = per_library_bundle(library_id)[name]
+    target = shared_collection(name)
+    last_id = None
+    while True:
+        query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+        docs = await source.find(query, {'_id': 1, 'active_borrows': 1}).sort('_id', 1).limit(batch_size).to_list(length=batch_size)
+        if not docs:
+            return
+        await target.bulk_write([
+            UpdateOne({'_id': doc['_id']}, {'$set': {'active_borrows': doc.get('active_borrows', 0)}}) for doc in docs
+        ], ordered=False)
+        last_id = docs[-1]['_id']
+
+async def prune_collection(library_id: str, name: str, batch_size: int) -> int:
+    """Delete from shared_<name> the library's documents that are gone from the per-library collection"""
+    source = per_library_bundle(library_id)[name]
+    target = shared_collection(name)
+    pruned = 0
+    last_id = None
+    while True:
+        query = {'library_id': library_id}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        ids = [doc['_id'] async for doc in target.find(query, {'_id': 1}).sort('_id', 1).limit(batch_size)]
+        if not ids:
+            return pruned
+        present = {doc['_id'] async for doc in source.find({'_id': {'$in': ids}}, {'_id': 1})}
+        missing = [doc_id for doc_id in ids if doc_id not in present]
+        if missing:
+            await target.bulk_write([DeleteMany({'_id': {'$in': missing}})])
+            pruned += len(missing)
+        last_id = ids[-1]
+
+async def migrate(libraries: Optional[list], batch_size: int, since: Optional[int]) -> bool:
+    connect()
+    try:
+        if await served_storage_layout() == 'shared':
+            print("A server has already started with STORAGE_LAYOUT=shared; copying now would overwrite or "
+                  "delete what it wrote since, so nothing was done.")
+            return False
+        started_at = await current_stamp()
+        await ensure_shared_indexes()
+        for library_id in libraries or await library_ids():
+            for name in INDEX_MANIFEST:
+                copied = await copy_collection(library_id, name, batch_size, since)
+                if since is not None and name in ('students', 'teachers'):
+                    await copy_loan_counters(library_id, name, batch_size)
+                pruned = await prune_collection(library_id, name, batch_size) if since is not None else 0
+                print(f"Library {library_id} {name}: {copied} copied, {pruned} removed")
+        print()
+        print(f"Next catch-up: python migrate_storage.py --since {started_at}")
+        return True
+    finally:
+        close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--library", action="append", dest="libraries", help="migrate only this library (repeatable)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--since", type=int, help="catch up on changes stamped after this value")
+    args = parser.parse_args()
+
+    sys.exit(0 if asyncio.run(migrate(args.libraries, args.batch_size, args.since)) else 1)
@@ -0,0 +1,65 @@
+import base64
+import binascii
+import json
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+# Documents per network write when streaming; one Mongo batch is ~100 documents
+NDJSON_CHUNK_SIZE = 100
+
+def encode_cursor(last_id: ObjectId) -> str:
+    """Turn the last _id of a page into an opaque cursor string"""
+    return base64.urlsafe_b64encode(last_id.binary).decode('ascii')
+
+def decode_cursor(cursor: str) -> ObjectId:
+    """Recover the _id a cursor points after; raises ValueError for garbage"""
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, InvalidId, UnicodeEncodeError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+async def fetch_page(collection, query: Dict, projection: Dict, limit: int,
+                     cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Fetch one page ordered by the always-indexed _id (keyset pagination).
+
+    Each page is a range scan starting right after the cursor, so its cost does
+    not depend on how deep into the collection it is. Returns the documents
+    (without _id) and the cursor for the next page, or None on the last page.
+    """
+    if cursor:
+        query = {**query, '_id': {'$gt': decode_cursor(cursor)}}
+
+    # _id is needed to build the next cursor; it is stripped before returning
+    projection = {key: value for key, value in projection.items() if key != '_id'} or None
+
+    docs = await collection.find(query, projection).sort('_id', 1).limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1]['_id'])
+
+    for doc in docs:
+        doc.pop('_id', None)
+    return docs, next_cursor
+
+async def iter_ndjson(collection, query: Dict, projection: Dict) -> AsyncIterator[str]:
+    """Stream documents as newline-delimited JSON straight off the Mongo cursor.
+
+    Only one chunk of documents is held at a time, so memory stays flat no
+    matter how large the collection is.
+    """
+    lines = []
+    async for doc in collection.find(query, projection).sort('_id', 1):
+        lines.append(json.dumps(doc, default=str))
+        if len(lines) >= NDJSON_CHUNK_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
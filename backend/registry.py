@@ -0,0 +1,96 @@
+import os
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from database import get_collections
+
+# Which collection holds each entity type
+ENTITY_COLLECTIONS = {
+    'book': 'books',
+    'magazine': 'magazines',
+    'student': 'students',
+    'teacher': 'teachers',
+}
+COLLECTION_TYPES = {name: entity_type for entity_type, name in ENTITY_COLLECTIONS.items()}
+
+# Most (library_id, entity_id) resolutions kept in memory
+REGISTRY_CACHE_SIZE = int(os.environ.get('REGISTRY_CACHE_SIZE', 100_000))
+
+_cache: "OrderedDict[Tuple[str, str], Tuple[str, str]]" = OrderedDict()
+
+def _remember(library_id: str, entity_id: str, entity_type: str):
+    key = (library_id, entity_id)
+    _cache[key] = (entity_type, ENTITY_COLLECTIONS[entity_type])
+    _cache.move_to_end(key)
+    while len(_cache) > REGISTRY_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+async def register(library_id: str, collection_name: str, entity_id: str):
+    """Record which collection an id lives in"""
+    entity_type = COLLECTION_TYPES[collection_name]
+    collections = await get_collections(library_id)
+    await collections['registry'].update_one(
+        {'id': entity_id}, {'$set': {'type': entity_type}}, upsert=True
+    )
+    _remember(library_id, entity_id, entity_type)
+
+async def register_many(library_id: str, collection_name: str, entity_ids: Iterable[str]):
+    """register() for a whole batch in one bulk write"""
+    entity_type = COLLECTION_TYPES[collection_name]
+    entity_ids = list(entity_ids)
+    if entity_ids:
+        collections = await get_collections(library_id)
+        await collections['registry'].bulk_write([
+            UpdateOne({'id': entity_id}, {'$set': {'type': entity_type}}, upsert=True) for entity_id in entity_ids
+        ], ordered=False)
+    for entity_id in entity_ids:
+        _remember(library_id, entity_id, entity_type)
+
+async def unregister(library_id: str, entity_id: str):
+    """Forget a deleted id"""
+    _cache.pop((library_id, entity_id), None)
+    collections = await get_collections(library_id)
+    await collections['registry'].delete_one({'id': entity_id})
+
+async def ensure_registry(library_id: str, batch_size: int = 1000):
+    """Backfill the registry once for ids written before it existed.
+
+    Runs at startup; skipped when the registry already has an entry for
+    every entity, so it costs a few counts once the backfill has happened.
+    """
+    collections = await get_collections(library_id)
+    entities = sum([await collections[name].count_documents({}) for name in COLLECTION_TYPES])
+    if await collections['registry'].count_documents({}) >= entities:
+        return
+    for collection_name, entity_type in COLLECTION_TYPES.items():
+        last_id = None
+        while True:
+            query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+            docs = await collections[collection_name].find(query, {'_id': 1, 'id': 1}).sort('_id', 1).limit(batch_size).to_list(length=batch_size)
+            if not docs:
+                break
+            await collections['registry'].bulk_write([
+                UpdateOne({'id': doc['id']}, {'$set': {'type': entity_type}}, upsert=True) for doc in docs
+            ], ordered=False)
+            last_id = docs[-1]['_id']
+
+async def resolve(library_id: str, entity_id: str) -> Optional[Tuple[str, str]]:
+    """(entity_type, collection_name) for an id, or None if nothing has it.
+
+    Served from memory when cached, otherwise from one registry lookup.
+    ensure_registry() has registered every id at startup and writes keep it
+    current, so an id the registry lacks does not exist.
+    """
+    key = (library_id, entity_id)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    collections = await get_collections(library_id)
+    entry = await collections['registry'].find_one({'id': entity_id}, {'_id': 0, 'type': 1})
+    if entry is None:
+        return None
+    _remember(library_id, entity_id, entry['type'])
+    return _cache[key]
@@ -0,0 +1,82 @@
+from typing import Dict, List, Optional
+
+from pymongo import DeleteMany, DeleteOne, InsertOne, UpdateMany, UpdateOne
+
+class ScopedCollection:
+    """One library's slice of a collection shared by every library.
+
+    Wraps a Motor collection whose documents carry a library_id field and
+    exposes the subset of the collection API this app uses. Every filter
+    gets library_id added, every inserted document gets it set and every
+    projection hides it, so callers see exactly what a per-library
+    collection would give them.
+    """
+
+    def __init__(self, collection, library_id: str):
+        self.raw = collection
+        self.library_id = library_id
+
+    def _filter(self, query: Optional[Dict]) -> Dict:
+        return {**(query or {}), 'library_id': self.library_id}
+
+    def _projection(self, projection: Optional[Dict]) -> Dict:
+        # Inclusion projections leave library_id out already; $meta and the like count as neither
+        if projection and any(value and not isinstance(value, dict) for key, value in projection.items() if key != '_id'):
+            return projection
+        return {**(projection or {}), 'library_id': 0}
+
+    def _document(self, doc: Dict) -> Dict:
+        return {**doc, 'library_id': self.library_id}
+
+    def _operation(self, operation):
+        if isinstance(operation, (UpdateOne, UpdateMany)):
+            return type(operation)(self._filter(operation._filter), operation._doc, upsert=operation._upsert,
+                                   collation=operation._collation, array_filters=operation._array_filters,
+                                   hint=operation._hint)
+        if isinstance(operation, (DeleteOne, DeleteMany)):
+            return type(operation)(self._filter(operation._filter), collation=operation._collation, hint=operation._hint)
+        if isinstance(operation, InsertOne):
+            return InsertOne(self._document(operation._doc))
+        raise TypeError(f"Unsupported bulk operation for a scoped collection: {type(operation).__name__}")
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None, **kwargs):
+        return self.raw.find(self._filter(query), self._projection(projection), **kwargs)
+
+    async def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None, **kwargs):
+        return await self.raw.find_one(self._filter(query), self._projection(projection), **kwargs)
+
+    async def find_one_and_update(self, query: Dict, update, projection: Optional[Dict] = None, **kwargs):
+        return await self.raw.find_one_and_update(self._filter(query), update, projection=self._projection(projection), **kwargs)
+
+    async def find_one_and_delete(self, query: Dict, projection: Optional[Dict] = None, **kwargs):
+        return await self.raw.find_one_and_delete(self._filter(query), projection=self._projection(projection), **kwargs)
+
+    async def count_documents(self, query: Dict, **kwargs) -> int:
+        return await self.raw.count_documents(self._filter(query), **kwargs)
+
+    async def insert_one(self, doc: Dict, **kwargs):
+        return await self.raw.insert_one(self._document(doc), **kwargs)
+
+    async def insert_many(self, docs: List[Dict], **kwargs):
+        return await self.raw.insert_many([self._document(doc) for doc in docs], **kwargs)
+
+    async def update_one(self, query: Dict, update, **kwargs):
+        return await self.raw.update_one(self._filter(query), update, **kwargs)
+
+    async def update_many(self, query: Dict, update, **kwargs):
+        return await self.raw.update_many(self._filter(query), update, **kwargs)
+
+    async def delete_one(self, query: Dict, **kwargs):
+        return await self.raw.delete_one(self._filter(query), **kwargs)
+
+    async def delete_many(self, query: Dict, **kwargs):
+        return await self.raw.delete_many(self._filter(query), **kwargs)
+
+    async def bulk_write(self, operations: List, **kwargs):
+        return await self.raw.bulk_write([self._operation(operation) for operation in operations], **kwargs)
+
+    def aggregate(self, pipeline: List[Dict], **kwargs):
+        return self.raw.aggregate([{'$match': {'library_id': self.library_id}}] + list(pipeline), **kwargs)
+
+    async def create_index(self, keys, **kwargs):
+        return await self.raw.create_index(keys, **kwargs)
@@ -1,14 +1,56 @@
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, File, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict
+from starlette.concurrency import iterate_in_threadpool
+from contextlib import asynccontextmanager
+from typing import List, Dict, Optional
 from datetime import datetime, timedelta
+import asyncio
+import gc
 import os
+import xml.etree.ElementTree as ET
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ExecutionTimeout
+from pydantic import ValidationError
 
 from models import Student, Teacher, Book, Magazine, BorrowRecord, BorrowRequest, ReturnRequest
-from database import get_collections
-from xml_utils import export_to_xml, import_from_xml, validate_xml
+from database import connect, close, record_storage_layout, get_collections, ensure_indexes, get_index_stats, ensure_default_libraries, library_ids, list_libraries, register_library, LibraryNotFound
+from autocomplete import build_index, get_index, index_document, index_documents, unindex_document
+from registry import register, register_many, unregister, resolve, ensure_registry, ENTITY_COLLECTIONS, COLLECTION_TYPES
+from stats import increment_stats, read_stats, reconcile_stats, write_deltas, add_deltas, reconcile_active_borrows, ensure_active_borrows, ensure_stats
+from sweeper import run_sweeper, sweep_all, repair_stranded_sweeps, sweep_metrics
+from cache import entity_cache
+from changes import change_stamp, settled_stamp, record_deletions, get_watermark, set_watermark, content_hash, is_unchanged
+from jobs import Job, jobs, job_handler, submit_job, cancel_job, describe_job, start_job_workers
+from pagination import fetch_page, iter_ndjson, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NDJSON_MEDIA_TYPE
+from xml_utils import iter_export_xml, iter_xml_batches, gzip_stream, import_from_xml, validate_xml
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect to Mongo, provision indexes, warm the autocomplete index and start the overdue sweeper and job workers"""
+    connect()
+    await record_storage_layout()
+    await ensure_default_libraries()
+    for library_id in await library_ids():
+        await ensure_indexes(library_id)
+        await ensure_active_borrows(library_id)
+        await ensure_stats(library_id)
+        await repair_stranded_sweeps(library_id)
+        await ensure_registry(library_id)
+        await build_index(library_id, await get_collections(library_id))
+    # The warmed autocomplete indexes live as long as the process; keep full collections from rescanning them
+    gc.freeze()
+    sweeper = asyncio.create_task(run_sweeper())
+    workers = await start_job_workers()
+    yield
+    sweeper.cancel()
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(sweeper, *workers, return_exceptions=True)
+    close()
 
-app = FastAPI(title="Library Management System")
+app = FastAPI(title="Library Management System", lifespan=lifespan)
 
 # CORS configuration
 app.add_middleware(
@@ -19,34 +61,231 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Bookkeeping kept on stored documents that the API never returns
+INTERNAL_FIELDS = ['modified', 'content_hash', 'active_borrows', 'overdue_sweep']
+PUBLIC_PROJECTION = {'_id': 0, **{field: 0 for field in INTERNAL_FIELDS}}
+
+def public_view(doc: Dict) -> Dict:
+    """A stored document as the API returns it"""
+    return {key: value for key, value in doc.items() if key != '_id' and key not in INTERNAL_FIELDS}
+
+def build_projection(fields: Optional[str], model) -> Dict:
+    """Turn a comma-separated fields parameter into a Mongo projection.
+
+    Only fields declared on the Pydantic model may be requested; without a
+    fields parameter every field but the internal bookkeeping is returned.
+    """
+    if not fields:
+        return dict(PUBLIC_PROJECTION)
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields for {model.__name__}: {', '.join(unknown)}")
+    projection = {field: 1 for field in requested}
+    projection['_id'] = 0
+    return projection
+
+async def get_entity(library_id: str, collection_name: str, entity_id: str, projection: Dict) -> Optional[Dict]:
+    """Read one document through entity_cache; the projection is applied to the cached public document"""
+    doc = entity_cache.get(library_id, collection_name, entity_id)
+    if doc is None:
+        token = entity_cache.token()
+        collections = await get_collections(library_id)
+        doc = await collections[collection_name].find_one({"id": entity_id}, PUBLIC_PROJECTION)
+        if doc is None:
+            return None
+        entity_cache.put(library_id, collection_name, entity_id, doc, token)
+    if projection == PUBLIC_PROJECTION:
+        return doc
+    return {field: doc[field] for field in projection if field != '_id' and field in doc}
+
+async def get_page(collection, limit: int, cursor: Optional[str], projection: Dict):
+    """Fetch one keyset page, turning a malformed cursor into a 400"""
+    try:
+        return await fetch_page(collection, {}, projection, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def list_response(request: Request, collection, key: str, limit: int, cursor: Optional[str], projection: Dict):
+    """Stream the whole collection as NDJSON when asked to, otherwise return one page"""
+    if NDJSON_MEDIA_TYPE in request.headers.get('accept', ''):
+        return StreamingResponse(iter_ndjson(collection, {}, projection), media_type=NDJSON_MEDIA_TYPE)
+    docs, next_cursor = await get_page(collection, limit, cursor, projection)
+    return {key: docs, "next_cursor": next_cursor}
+
+async def entity_saved(library_id: str, collection_name: str, doc: Dict, previous_id: Optional[str] = None):
+    """Bring the id registry, autocomplete index and entity cache in line with a created or updated document"""
+    entity_cache.invalidate(library_id, collection_name, [doc['id']] if previous_id is None else [doc['id'], previous_id])
+    if previous_id is not None:
+        unindex_document(library_id, previous_id)
+    index_document(library_id, collection_name, doc)
+    if previous_id != doc['id']:
+        if previous_id is not None:
+            await unregister(library_id, previous_id)
+            await record_deletions(library_id, collection_name, [previous_id])
+        await register(library_id, collection_name, doc['id'])
+
+async def entities_saved(library_id: str, collection_name: str, docs: List[Dict]):
+    """entity_saved for a bulk write"""
+    entity_cache.invalidate(library_id, collection_name, [doc['id'] for doc in docs])
+    await index_documents(library_id, collection_name, docs)
+    await register_many(library_id, collection_name, [doc['id'] for doc in docs])
+
+async def entity_deleted(library_id: str, collection_name: str, entity_id: str):
+    """Drop a deleted document from the id registry, autocomplete index and entity cache and leave a tombstone"""
+    entity_cache.invalidate(library_id, collection_name, [entity_id])
+    unindex_document(library_id, entity_id)
+    await unregister(library_id, entity_id)
+    await record_deletions(library_id, collection_name, [entity_id])
+
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "message": "Library Management System API is running"}
 
+# Largest row count accepted by one bulk create call, and the default write chunk
+MAX_BULK_CREATE_ROWS = 10000
+DEFAULT_BULK_CHUNK_SIZE = 500
+
+ENTITY_MODELS = {'books': Book, 'magazines': Magazine, 'students': Student, 'teachers': Teacher}
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors())
+
+async def bulk_create(library_id: str, collection_name: str, rows: List[Dict], chunk_size: int, upsert: bool):
+    """Validate rows against the entity's model, then write the valid ones in unordered chunks.
+
+    A bad row (validation failure or write error) is reported by index and
+    never stops the rest of the batch.
+    """
+    if len(rows) > MAX_BULK_CREATE_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_CREATE_ROWS} rows per request")
+    collections = await get_collections(library_id)
+    model = ENTITY_MODELS[collection_name]
+    is_person = collection_name in ('students', 'teachers')
+    
+    errors = []
+    valid = []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, model.model_validate(row).model_dump()))
+        except ValidationError as e:
+            errors.append({"index": index, "error": validation_message(e)})
+    
+    written, deltas = [], {}
+    inserted = updated = 0
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        failed = set()
+        if upsert:
+            stored = {
+                doc['id']: doc
+                async for doc in collections[collection_name].find({"id": {"$in": [doc['id'] for _, doc in chunk]}},
+                                                                   {'_id': 0, 'id': 1, 'available': 1})
+            }
+        async with change_stamp() as stamp:
+            for _, doc in chunk:
+                doc['modified'] = stamp
+                doc['content_hash'] = content_hash(doc)
+            try:
+                if upsert:
+                    result = await collections[collection_name].bulk_write([
+                        UpdateOne({"id": doc['id']}, {"$set": doc, **({"$setOnInsert": {"active_borrows": 0}} if is_person else {})}, upsert=True)
+                        for _, doc in chunk
+                    ], ordered=False)
+                    inserted += result.upserted_count
+                    updated += result.matched_count
+                else:
+                    result = await collections[collection_name].insert_many(
+                        [{**doc, **({"active_borrows": 0} if is_person else {})} for _, doc in chunk], ordered=False
+                    )
+                    inserted += len(result.inserted_ids)
+            except BulkWriteError as e:
+                for write_error in e.details.get('writeErrors', []):
+                    failed.add(write_error['index'])
+                    errors.append({"index": chunk[write_error['index']][0], "error": write_error.get('errmsg', 'Write failed')})
+                inserted += e.details.get('nInserted', 0) + e.details.get('nUpserted', 0)
+                updated += e.details.get('nMatched', 0)
+        saved = [doc for position, (_, doc) in enumerate(chunk) if position not in failed]
+        if upsert:
+            for doc in saved:
+                add_deltas(deltas, write_deltas(collection_name, doc, stored.get(doc['id'])))
+                stored[doc['id']] = doc
+        written.extend(saved)
+    
+    await entities_saved(library_id, collection_name, written)
+    if upsert:
+        await increment_stats(library_id, **deltas)
+    elif collection_name in ('books', 'magazines'):
+        await increment_stats(library_id, **{f"total_{collection_name}": len(written),
+                                             f"available_{collection_name}": sum(1 for doc in written if doc['available'])})
+    else:
+        await increment_stats(library_id, **{f"total_{collection_name}": len(written)})
+    
+    errors.sort(key=lambda error: error["index"])
+    return {"inserted": inserted, "updated": updated, "failed": len(errors), "errors": errors}
+
+# ==================== LIBRARIES ====================
+
+@app.exception_handler(LibraryNotFound)
+async def library_not_found(request: Request, exc: LibraryNotFound):
+    return JSONResponse(status_code=404, content={"detail": "Library not found"})
+
+@app.get("/api/libraries")
+async def get_libraries():
+    """All registered libraries"""
+    return {"libraries": [{"id": library.pop('_id'), **library} for library in await list_libraries()]}
+
+@app.post("/api/libraries")
+async def create_library(library: Dict = Body(...)):
+    """Register a new branch library; its collections and indexes are created right away"""
+    library_id = str(library.get('id', '')).strip().lower()
+    name = library.get('name') or f"Library {library_id.upper()}"
+    try:
+        created = await register_library(library_id, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not created:
+        raise HTTPException(status_code=409, detail="Library already exists")
+    await ensure_indexes(library_id)
+    await ensure_stats(library_id)
+    await build_index(library_id, await get_collections(library_id))
+    return {"message": "Library created successfully", "library": {"id": library_id, "name": name}}
+
 # ==================== STUDENT ENDPOINTS ====================
 
 @app.get("/api/library/{library_id}/students")
-async def get_students(library_id: str):
-    """Get all students from a library"""
-    collections = get_collections(library_id)
-    students = list(collections['students'].find({}, {'_id': 0}))
-    return {"students": students}
+async def get_students(library_id: str, request: Request, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, fields: Optional[str] = None):
+    """Get one page of students from a library (or all of them as NDJSON)"""
+    projection = build_projection(fields, Student)
+    collections = await get_collections(library_id)
+    return await list_response(request, collections['students'], "students", limit, cursor, projection)
 
 @app.post("/api/library/{library_id}/students")
 async def create_student(library_id: str, student: Student):
     """Create a new student - demonstrates Polymorphism (different from Teacher)"""
-    collections = get_collections(library_id)
+    collections = await get_collections(library_id)
     student_dict = student.model_dump()
-    collections['students'].insert_one(student_dict)
+    student_dict['active_borrows'] = 0
+    async with change_stamp() as stamp:
+        student_dict['modified'] = stamp
+        student_dict['content_hash'] = content_hash(student_dict)
+        await collections['students'].insert_one(student_dict)
+    await entity_saved(library_id, 'students', student_dict)
+    await increment_stats(library_id, total_students=1)
     # Remove MongoDB ObjectId before returning
     student_dict.pop('_id', None)
-    return {"message": "Student created successfully", "student": student_dict}
+    return {"message": "Student created successfully", "student": public_view(student_dict)}
+
+@app.post("/api/library/{library_id}/students/bulk")
+async def bulk_create_students(library_id: str, rows: List[Dict] = Body(...), chunk_size: int = Query(DEFAULT_BULK_CHUNK_SIZE, ge=1, le=MAX_BULK_CREATE_ROWS), upsert: bool = False):
+    """Create (or with upsert=true, create-or-update by id) many students in one call"""
+    return await bulk_create(library_id, 'students', rows, chunk_size, upsert)
 
 @app.get("/api/library/{library_id}/students/{student_id}")
-async def get_student(library_id: str, student_id: str):
+async def get_student(library_id: str, student_id: str, fields: Optional[str] = None):
     """Get a specific student"""
-    collections = get_collections(library_id)
-    student = collections['students'].find_one({"id": student_id}, {'_id': 0})
+    projection = build_projection(fields, Student)
+    student = await get_entity(library_id, 'students', student_id, projection)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     return student
@@ -54,46 +293,63 @@ async def get_student(library_id: str, student_id: str):
 @app.put("/api/library/{library_id}/students/{student_id}")
 async def update_student(library_id: str, student_id: str, student: Student):
     """Update a student"""
-    collections = get_collections(library_id)
+    collections = await get_collections(library_id)
     student_dict = student.model_dump()
-    result = collections['students'].update_one({"id": student_id}, {"$set": student_dict})
+    async with change_stamp() as stamp:
+        student_dict['modified'] = stamp
+        student_dict['content_hash'] = content_hash(student_dict)
+        result = await collections['students'].update_one({"id": student_id}, {"$set": student_dict})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Student not found")
-    return {"message": "Student updated successfully", "student": student_dict}
+    await entity_saved(library_id, 'students', student_dict, previous_id=student_id)
+    return {"message": "Student updated successfully", "student": public_view(student_dict)}
 
 @app.delete("/api/library/{library_id}/students/{student_id}")
 async def delete_student(library_id: str, student_id: str):
     """Delete a student"""
-    collections = get_collections(library_id)
-    result = collections['students'].delete_one({"id": student_id})
+    collections = await get_collections(library_id)
+    result = await collections['students'].delete_one({"id": student_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Student not found")
+    await entity_deleted(library_id, 'students', student_id)
+    await increment_stats(library_id, total_students=-1)
     return {"message": "Student deleted successfully"}
 
 # ==================== TEACHER ENDPOINTS ====================
 
 @app.get("/api/library/{library_id}/teachers")
-async def get_teachers(library_id: str):
-    """Get all teachers from a library"""
-    collections = get_collections(library_id)
-    teachers = list(collections['teachers'].find({}, {'_id': 0}))
-    return {"teachers": teachers}
+async def get_teachers(library_id: str, request: Request, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, fields: Optional[str] = None):
+    """Get one page of teachers from a library (or all of them as NDJSON)"""
+    projection = build_projection(fields, Teacher)
+    collections = await get_collections(library_id)
+    return await list_response(request, collections['teachers'], "teachers", limit, cursor, projection)
 
 @app.post("/api/library/{library_id}/teachers")
 async def create_teacher(library_id: str, teacher: Teacher):
     """Create a new teacher - demonstrates Polymorphism (different from Student)"""
-    collections = get_collections(library_id)
+    collections = await get_collections(library_id)
     teacher_dict = teacher.model_dump()
-    collections['teachers'].insert_one(teacher_dict)
+    teacher_dict['active_borrows'] = 0
+    async with change_stamp() as stamp:
+        teacher_dict['modified'] = stamp
+        teacher_dict['content_hash'] = content_hash(teacher_dict)
+        await collections['teachers'].insert_one(teacher_dict)
+    await entity_saved(library_id, 'teachers', teacher_dict)
+    await increment_stats(library_id, total_teachers=1)
     # Remove MongoDB ObjectId before returning
     teacher_dict.pop('_id', None)
-    return {"message": "Teacher created successfully", "teacher": teacher_dict}
+    return {"message": "Teacher created successfully", "teacher": public_view(teacher_dict)}
+
+@app.post("/api/library/{library_id}/teachers/bulk")
+async def bulk_create_teachers(library_id: str, rows: List[Dict] = Body(...), chunk_size: int = Query(DEFAULT_BULK_CHUNK_SIZE, ge=1, le=MAX_BULK_CREATE_ROWS), upsert: bool = False):
+    """Create (or with upsert=true, create-or-update by id) many teachers in one call"""
+    return await bulk_create(library_id, 'teachers', rows, chunk_size, upsert)
 
 @app.get("/api/library/{library_id}/teachers/{teacher_id}")
-async def get_teacher(library_id: str, teacher_id: str):
+async def get_teacher(library_id: str, teacher_id: str, fields: Optional[str] = None):
     """Get a specific teacher"""
-    collections = get_collections(library_id)
-    teacher = collections['teachers'].find_one({"id": teacher_id}, {'_id': 0})
+    projection = build_projection(fields, Teacher)
+    teacher = await get_entity(library_id, 'teachers', teacher_id, projection)
     if not teacher:
         raise HTTPException(status_code=404, detail="Teacher not found")
     return teacher
@@ -101,46 +357,62 @@ async def get_teacher(library_id: str, teacher_id: str):
 @app.put("/api/library/{library_id}/teachers/{teacher_id}")
 async def update_teacher(library_id: str, teacher_id: str, teacher: Teacher):
     """Update a teacher"""
-    collections = get_collections(library_id)
+    collections = await get_collections(library_id)
     teacher_dict = teacher.model_dump()
-    result = collections['teachers'].update_one({"id": teacher_id}, {"$set": teacher_dict})
+    async with change_stamp() as stamp:
+        teacher_dict['modified'] = stamp
+        teacher_dict['content_hash'] = content_hash(teacher_dict)
+        result = await collections['teachers'].update_one({"id": teacher_id}, {"$set": teacher_dict})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Teacher not found")
-    return {"message": "Teacher updated successfully", "teacher": teacher_dict}
+    await entity_saved(library_id, 'teachers', teacher_dict, previous_id=teacher_id)
+    return {"message": "Teacher updated successfully", "teacher": public_view(teacher_dict)}
 
 @app.delete("/api/library/{library_id}/teachers/{teacher_id}")
 async def delete_teacher(library_id: str, teacher_id: str):
     """Delete a teacher"""
-    collections = get_collections(library_id)
-    result = collections['teachers'].delete_one({"id": teacher_id})
+    collections = await get_collections(library_id)
+    result = await collections['teachers'].delete_one({"id": teacher_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Teacher not found")
+    await entity_deleted(library_id, 'teachers', teacher_id)
+    await increment_stats(library_id, total_teachers=-1)
     return {"message": "Teacher deleted successfully"}
 
 # ==================== BOOK ENDPOINTS ====================
 
 @app.get("/api/library/{library_id}/books")
-async def get_books(library_id: str):
-    """Get all books from a library"""
-    collections = get_collections(library_id)
-    books = list(collections['books'].find({}, {'_id': 0}))
-    return {"books": books}
+async def get_books(library_id: str, request: Request, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, fields: Optional[str] = None):
+    """Get one page of books from a library (or all of them as NDJSON)"""
+    projection = build_projection(fields, Book)
+    collections = await get_collections(library_id)
+    return await list_response(request, collections['books'], "books", limit, cursor, projection)
 
 @app.post("/api/library/{library_id}/books")
 async def create_book(library_id: str, book: Book):
     """Create a new book - demonstrates Polymorphism (different from Magazine)"""
-    collections = get_collections(library_id)
+    collections = await get_collections(library_id)
     book_dict = book.model_dump()
-    collections['books'].insert_one(book_dict)
+    async with change_stamp() as stamp:
+        book_dict['modified'] = stamp
+        book_dict['content_hash'] = content_hash(book_dict)
+        await collections['books'].insert_one(book_dict)
+    await entity_saved(library_id, 'books', book_dict)
+    await increment_stats(library_id, total_books=1, available_books=int(book_dict['available']))
     # Remove MongoDB ObjectId before returning
     book_dict.pop('_id', None)
-    return {"message": "Book created successfully", "book": book_dict}
+    return {"message": "Book created successfully", "book": public_view(book_dict)}
+
+@app.post("/api/library/{library_id}/books/bulk")
+async def bulk_create_books(library_id: str, rows: List[Dict] = Body(...), chunk_size: int = Query(DEFAULT_BULK_CHUNK_SIZE, ge=1, le=MAX_BULK_CREATE_ROWS), upsert: bool = False):
+    """Create (or with upsert=true, create-or-update by id) many books in one call"""
+    return await bulk_create(library_id, 'books', rows, chunk_size, upsert)
 
 @app.get("/api/library/{library_id}/books/{book_id}")
-async def get_book(library_id: str, book_id: str):
+async def get_book(library_id: str, book_id: str, fields: Optional[str] = None):
     """Get a specific book"""
-    collections = get_collections(library_id)
-    book = collections['books'].find_one({"id": book_id}, {'_id': 0})
+    projection = build_projection(fields, Book)
+    book = await get_entity(library_id, 'books', book_id, projection)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
     return book
@@ -148,46 +420,65 @@ async def get_book(library_id: str, book_id: str):
 @app.put("/api/library/{library_id}/books/{book_id}")
 async def update_book(library_id: str, book_id: str, book: Book):
     """Update a book"""
-    collections = get_collections(library_id)
+    collections = await get_collections(library_id)
     book_dict = book.model_dump()
-    result = collections['books'].update_one({"id": book_id}, {"$set": book_dict})
-    if result.matched_count == 0:
+    async with change_stamp() as stamp:
+        book_dict['modified'] = stamp
+        book_dict['content_hash'] = content_hash(book_dict)
+        previous = await collections['books'].find_one_and_update(
+            {"id": book_id}, {"$set": book_dict}, projection={'_id': 0, 'available': 1}
+        )
+    if previous is None:
         raise HTTPException(status_code=404, detail="Book not found")
-    return {"message": "Book updated successfully", "book": book_dict}
+    await increment_stats(library_id, available_books=int(book_dict['available']) - int(previous.get('available', True)))
+    await entity_saved(library_id, 'books', book_dict, previous_id=book_id)
+    return {"message": "Book updated successfully", "book": public_view(book_dict)}
 
 @app.delete("/api/library/{library_id}/books/{book_id}")
 async def delete_book(library_id: str, book_id: str):
     """Delete a book"""
-    collections = get_collections(library_id)
-    result = collections['books'].delete_one({"id": book_id})
-    if result.deleted_count == 0:
+    collections = await get_collections(library_id)
+    deleted = await collections['books'].find_one_and_delete({"id": book_id}, projection={'_id': 0, 'available': 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Book not found")
+    await entity_deleted(library_id, 'books', book_id)
+    await increment_stats(library_id, total_books=-1, available_books=-int(deleted.get('available', True)))
     return {"message": "Book deleted successfully"}
 
 # ==================== MAGAZINE ENDPOINTS ====================
 
 @app.get("/api/library/{library_id}/magazines")
-async def get_magazines(library_id: str):
-    """Get all magazines from a library"""
-    collections = get_collections(library_id)
-    magazines = list(collections['magazines'].find({}, {'_id': 0}))
-    return {"magazines": magazines}
+async def get_magazines(library_id: str, request: Request, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, fields: Optional[str] = None):
+    """Get one page of magazines from a library (or all of them as NDJSON)"""
+    projection = build_projection(fields, Magazine)
+    collections = await get_collections(library_id)
+    return await list_response(request, collections['magazines'], "magazines", limit, cursor, projection)
 
 @app.post("/api/library/{library_id}/magazines")
 async def create_magazine(library_id: str, magazine: Magazine):
     """Create a new magazine - demonstrates Polymorphism (different from Book)"""
-    collections = get_collections(library_id)
+    collections = await get_collections(library_id)
     magazine_dict = magazine.model_dump()
-    collections['magazines'].insert_one(magazine_dict)
+    async with change_stamp() as stamp:
+        magazine_dict['modified'] = stamp
+        magazine_dict['content_hash'] = content_hash(magazine_dict)
+        await collections['magazines'].insert_one(magazine_dict)
+    await entity_saved(library_id, 'magazines', magazine_dict)
+    await increment_stats(library_id, total_magazines=1, available_magazines=int(magazine_dict['available']))
     # Remove MongoDB ObjectId before returning
     magazine_dict.pop('_id', None)
-    return {"message": "Magazine created successfully", "magazine": magazine_dict}
+    return {"message": "Magazine created successfully", "magazine": public_view(magazine_dict)}
+
+@app.post("/api/library/{library_id}/magazines/bulk")
+async def bulk_create_magazines(library_id: str, rows: List[Dict] = Body(...), chunk_size: int = Query(DEFAULT_BULK_CHUNK_SIZE, ge=1, le=MAX_BULK_CREATE_ROWS), upsert: bool = False):
+    """Create (or with upsert=true, create-or-update by id) many magazines in one call"""
+    return await bulk_create(library_id, 'magazines', rows, chunk_size, upsert)
 
 @app.get("/api/library/{library_id}/magazines/{magazine_id}")
-async def get_magazine(library_id: str, magazine_id: str):
+async def get_magazine(library_id: str, magazine_id: str, fields: Optional[str] = None):
     """Get a specific magazine"""
-    collections = get_collections(library_id)
-    magazine = collections['magazines'].find_one({"id": magazine_id}, {'_id': 0})
+    projection = build_projection(fields, Magazine)
+    magazine = await get_entity(library_id, 'magazines', magazine_id, projection)
     if not magazine:
         raise HTTPException(status_code=404, detail="Magazine not found")
     return magazine
@@ -195,181 +486,529 @@ async def get_magazine(library_id: str, magazine_id: str):
 @app.put("/api/library/{library_id}/magazines/{magazine_id}")
 async def update_magazine(library_id: str, magazine_id: str, magazine: Magazine):
     """Update a magazine"""
-    collections = get_collections(library_id)
+    collections = await get_collections(library_id)
     magazine_dict = magazine.model_dump()
-    result = collections['magazines'].update_one({"id": magazine_id}, {"$set": magazine_dict})
-    if result.matched_count == 0:
+    async with change_stamp() as stamp:
+        magazine_dict['modified'] = stamp
+        magazine_dict['content_hash'] = content_hash(magazine_dict)
+        previous = await collections['magazines'].find_one_and_update(
+            {"id": magazine_id}, {"$set": magazine_dict}, projection={'_id': 0, 'available': 1}
+        )
+    if previous is None:
         raise HTTPException(status_code=404, detail="Magazine not found")
-    return {"message": "Magazine updated successfully", "magazine": magazine_dict}
+    await increment_stats(library_id, available_magazines=int(magazine_dict['available']) - int(previous.get('available', True)))
+    await entity_saved(library_id, 'magazines', magazine_dict, previous_id=magazine_id)
+    return {"message": "Magazine updated successfully", "magazine": public_view(magazine_dict)}
 
 @app.delete("/api/library/{library_id}/magazines/{magazine_id}")
 async def delete_magazine(library_id: str, magazine_id: str):
     """Delete a magazine"""
-    collections = get_collections(library_id)
-    result = collections['magazines'].delete_one({"id": magazine_id})
-    if result.deleted_count == 0:
+    collections = await get_collections(library_id)
+    deleted = await collections['magazines'].find_one_and_delete({"id": magazine_id}, projection={'_id': 0, 'available': 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Magazine not found")
+    await entity_deleted(library_id, 'magazines', magazine_id)
+    await increment_stats(library_id, total_magazines=-1, available_magazines=-int(deleted.get('available', True)))
     return {"message": "Magazine deleted successfully"}
 
 # ==================== BORROW/RETURN OPERATIONS ====================
 
-@app.post("/api/library/{library_id}/borrow")
-async def borrow_item(library_id: str, request: BorrowRequest):
-    """Borrow an item - demonstrates Polymorphism (different rules for students/teachers)"""
-    collections = get_collections(library_id)
-    
-    # Check if item exists and is available
-    item = collections['books'].find_one({"id": request.item_id}, {'_id': 0})
-    item_type = "book"
-    if not item:
-        item = collections['magazines'].find_one({"id": request.item_id}, {'_id': 0})
-        item_type = "magazine"
-    
-    if not item:
+ITEM_TYPES = ["book", "magazine"]
+PERSON_TYPES = ["student", "teacher"]
+
+async def claim_item(library_id: str, collections, item_id: str):
+    """Atomically flip an available item to unavailable and return (item, item_type).
+
+    The registry names the one collection to touch, and the available=True
+    filter makes the claim the single point of truth under concurrency: of
+    several simultaneous borrows, exactly one gets a document back.
+    """
+    entry = await resolve(library_id, item_id)
+    if not entry or entry[0] not in ITEM_TYPES:
         raise HTTPException(status_code=404, detail="Item not found")
+    item_type, collection_name = entry
     
-    if not item['available']:
-        raise HTTPException(status_code=400, detail="Item is not available")
-    
-    # Check if person exists
-    person = collections['students'].find_one({"id": request.person_id}, {'_id': 0})
-    person_type = "student"
-    if not person:
-        person = collections['teachers'].find_one({"id": request.person_id}, {'_id': 0})
-        person_type = "teacher"
-    
-    if not person:
-        raise HTTPException(status_code=404, detail="Person not found")
-    
-    # Check borrow limit (Polymorphism: different limits for students vs teachers)
-    active_borrows = collections['borrow_records'].count_documents({
-        "person_id": request.person_id,
-        "status": "borrowed"
-    })
-    
-    max_limit = person.get('max_borrow_limit', 5)
-    if active_borrows >= max_limit:
-        raise HTTPException(status_code=400, detail=f"Borrow limit reached ({max_limit} items)")
+    async with change_stamp() as stamp:
+        item = await collections[collection_name].find_one_and_update(
+            {"id": item_id, "available": True},
+            {"$set": {"available": False, "modified": stamp}},
+            projection={'_id': 0, 'title': 1}
+        )
+    if item:
+        entity_cache.invalidate(library_id, collection_name, [item_id])
+        return item, item_type
     
-    # Create borrow record
-    borrow_date = datetime.now().strftime("%Y-%m-%d")
-    due_date = (datetime.now() + timedelta(days=14)).strftime("%Y-%m-%d")
+    # Claim failed: tell an item that is already out apart from one deleted meanwhile
+    if await collections[collection_name].find_one({"id": item_id}, {'_id': 1}):
+        raise HTTPException(status_code=400, detail="Item is not available")
+    raise HTTPException(status_code=404, detail="Item not found")
+
+async def release_item(library_id: str, collections, item_type: str, item_id: str):
+    """Compensate a claim_item whose borrow could not be completed"""
+    async with change_stamp() as stamp:
+        await collections[ENTITY_COLLECTIONS[item_type]].update_one({"id": item_id}, {"$set": {"available": True, "modified": stamp}})
+    entity_cache.invalidate(library_id, ENTITY_COLLECTIONS[item_type], [item_id])
+
+@app.post("/api/library/{library_id}/borrow")
+async def borrow_item(library_id: str, request: BorrowRequest):
+    """Borrow an item - demonstrates Polymorphism (different rules for students/teachers)"""
+    collections = await get_collections(library_id)
     
-    borrow_record = BorrowRecord(
-        person_id=request.person_id,
-        person_name=person['name'],
-        person_type=person_type,
-        item_id=request.item_id,
-        item_title=item['title'],
-        item_type=item_type,
-        borrow_date=borrow_date,
-        due_date=due_date,
-        status="borrowed"
-    )
+    # Claim the item first; every later failure hands it back
+    item, item_type = await claim_item(library_id, collections, request.item_id)
     
-    # Update item availability
-    if item_type == "book":
-        collections['books'].update_one({"id": request.item_id}, {"$set": {"available": False}})
-    else:
-        collections['magazines'].update_one({"id": request.item_id}, {"$set": {"available": False}})
+    person_collection = None
+    try:
+        # Count the loan against the person in the same step that checks the
+        # limit (Polymorphism: different limits for students vs teachers)
+        entry = await resolve(library_id, request.person_id)
+        if not entry or entry[0] not in PERSON_TYPES:
+            raise HTTPException(status_code=404, detail="Person not found")
+        person_type, collection_name = entry
+        
+        person = await collections[collection_name].find_one_and_update(
+            {"id": request.person_id, "$expr": {"$lt": [
+                {"$ifNull": ["$active_borrows", 0]},
+                {"$ifNull": ["$max_borrow_limit", 5]}
+            ]}},
+            {"$inc": {"active_borrows": 1}},
+            projection={'_id': 0, 'name': 1}
+        )
+        entity_cache.invalidate(library_id, collection_name, [request.person_id])
+        if not person:
+            limits = await collections[collection_name].find_one({"id": request.person_id}, {'_id': 0, 'max_borrow_limit': 1})
+            if not limits:
+                raise HTTPException(status_code=404, detail="Person not found")
+            max_limit = limits.get('max_borrow_limit', 5)
+            raise HTTPException(status_code=400, detail=f"Borrow limit reached ({max_limit} items)")
+        person_collection = collection_name
+        
+        # Create borrow record
+        borrow_date = datetime.now().strftime("%Y-%m-%d")
+        due_date = (datetime.now() + timedelta(days=14)).strftime("%Y-%m-%d")
+        
+        borrow_record = BorrowRecord(
+            person_id=request.person_id,
+            person_name=person['name'],
+            person_type=person_type,
+            item_id=request.item_id,
+            item_title=item['title'],
+            item_type=item_type,
+            borrow_date=borrow_date,
+            due_date=due_date,
+            status="borrowed"
+        )
+        
+        # Insert borrow record
+        await collections['borrow_records'].insert_one(borrow_record.model_dump())
+    except BaseException:
+        await release_item(library_id, collections, item_type, request.item_id)
+        if person_collection:
+            await collections[person_collection].update_one({"id": request.person_id}, {"$inc": {"active_borrows": -1}})
+            entity_cache.invalidate(library_id, person_collection, [request.person_id])
+        raise
     
-    # Insert borrow record
-    collections['borrow_records'].insert_one(borrow_record.model_dump())
+    await increment_stats(library_id, active_borrows=1, **{f"available_{item_type}s": -1})
     
     return {"message": "Item borrowed successfully", "record": borrow_record.model_dump()}
 
 @app.post("/api/library/{library_id}/return")
 async def return_item(library_id: str, request: ReturnRequest):
-    """Return an item"""
-    collections = get_collections(library_id)
+    """Return an item (on time or overdue)"""
+    collections = await get_collections(library_id)
     
-    # Find borrow record
-    record = collections['borrow_records'].find_one({"id": request.record_id}, {'_id': 0})
-    if not record:
-        raise HTTPException(status_code=404, detail="Borrow record not found")
-    
-    if record['status'] != "borrowed":
-        raise HTTPException(status_code=400, detail="Item already returned")
-    
-    # Update borrow record
+    # Close the record in one step; the filter stops two returns racing each other
     return_date = datetime.now().strftime("%Y-%m-%d")
-    collections['borrow_records'].update_one(
-        {"id": request.record_id},
-        {"$set": {"status": "returned", "return_date": return_date}}
+    record = await collections['borrow_records'].find_one_and_update(
+        {"id": request.record_id, "status": {"$in": ["borrowed", "overdue"]}},
+        {"$set": {"status": "returned", "return_date": return_date}},
+        projection={'_id': 0},
+        return_document=ReturnDocument.BEFORE
     )
+    if not record:
+        if await collections['borrow_records'].find_one({"id": request.record_id}, {'_id': 1}):
+            raise HTTPException(status_code=400, detail="Item already returned")
+        raise HTTPException(status_code=404, detail="Borrow record not found")
     
     # Update item availability
-    if record['item_type'] == "book":
-        collections['books'].update_one({"id": record['item_id']}, {"$set": {"available": True}})
+    await release_item(library_id, collections, record['item_type'], record['item_id'])
+    
+    # Overdue loans were already taken off the person's active count by the sweeper
+    if record['status'] == "borrowed":
+        await collections[ENTITY_COLLECTIONS[record['person_type']]].update_one(
+            {"id": record['person_id']}, {"$inc": {"active_borrows": -1}}
+        )
+        entity_cache.invalidate(library_id, ENTITY_COLLECTIONS[record['person_type']], [record['person_id']])
+        await increment_stats(library_id, active_borrows=-1, **{f"available_{record['item_type']}s": 1})
     else:
-        collections['magazines'].update_one({"id": record['item_id']}, {"$set": {"available": True}})
+        await increment_stats(library_id, overdue_items=-1, **{f"available_{record['item_type']}s": 1})
     
     return {"message": "Item returned successfully"}
 
-@app.get("/api/library/{library_id}/borrow-records")
-async def get_borrow_records(library_id: str):
-    """Get all borrow records"""
-    collections = get_collections(library_id)
-    records = list(collections['borrow_records'].find({}, {'_id': 0}))
+# Largest batch accepted by the bulk borrow/return/create endpoints
+MAX_BULK_ENTRIES = 1000
+
+def check_bulk_size(entries: List):
+    if len(entries) > MAX_BULK_ENTRIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_ENTRIES} entries per request")
+
+async def find_by_ids(collections, names: List[str], ids: List[str], projection: Dict) -> Dict[str, tuple]:
+    """{id: (collection_name, doc)} for ids found in any of the named collections, one $in query each"""
+    found = {}
+    for name in names:
+        async for doc in collections[name].find({"id": {"$in": ids}}, projection):
+            found[doc['id']] = (name, doc)
+    return found
+
+@app.post("/api/library/{library_id}/borrow/bulk")
+async def bulk_borrow_items(library_id: str, entries: List[BorrowRequest]):
+    """Borrow many items at once, reporting success or failure per entry.
+
+    Items and people are looked up with batched $in queries. Available items
+    are claimed with the same guarded update single borrows use, all in
+    flight at once, so the claims this request won are exactly the updates
+    that matched. Loans are then counted against each person the same way,
+    and the records go in with one insert_many.
+    """
+    check_bulk_size(entries)
+    collections = await get_collections(library_id)
+    results = [{"index": i, "item_id": e.item_id, "person_id": e.person_id, "status": "failed"} for i, e in enumerate(entries)]
     
-    # Check for overdue items
-    today = datetime.now().strftime("%Y-%m-%d")
-    for record in records:
-        if record['status'] == 'borrowed' and record['due_date'] < today:
-            record['status'] = 'overdue'
-            collections['borrow_records'].update_one(
-                {"id": record['id']},
-                {"$set": {"status": "overdue"}}
-            )
+    item_ids = list({e.item_id for e in entries})
+    person_ids = list({e.person_id for e in entries})
+    items = await find_by_ids(collections, ['books', 'magazines'], item_ids, {'_id': 0, 'id': 1, 'title': 1, 'available': 1})
+    people = await find_by_ids(collections, ['students', 'teachers'], person_ids, {'_id': 0, 'id': 1, 'name': 1, 'max_borrow_limit': 1, 'active_borrows': 1})
     
-    return {"records": records}
-
-@app.get("/api/library/{library_id}/search")
-async def search_library(library_id: str, query: str = ""):
-    """Search for items or people in the library"""
-    collections = get_collections(library_id)
+    # Validate in request order; the same item can only be handed out once per batch
+    planned = []
+    planned_items = set()
+    for entry, result in zip(entries, results):
+        if entry.item_id not in items:
+            result["error"] = "Item not found"
+        elif entry.person_id not in people:
+            result["error"] = "Person not found"
+        elif not items[entry.item_id][1].get('available') or entry.item_id in planned_items:
+            result["error"] = "Item is not available"
+        else:
+            planned_items.add(entry.item_id)
+            planned.append((entry, result))
     
-    query_lower = query.lower()
+    # Claim the planned items atomically; anything taken meanwhile drops out
+    async def claim(item_id: str, stamp: int):
+        name = items[item_id][0]
+        item = await collections[name].find_one_and_update(
+            {"id": item_id, "available": True},
+            {"$set": {"available": False, "modified": stamp}},
+            projection={'_id': 1}
+        )
+        entity_cache.invalidate(library_id, name, [item_id])
+        return item_id, item is not None
     
-    # Search books
-    books = list(collections['books'].find({}, {'_id': 0}))
-    matched_books = [b for b in books if query_lower in b['title'].lower() or query_lower in b['author'].lower()]
+    async with change_stamp() as stamp:
+        claims = await asyncio.gather(*[claim(e.item_id, stamp) for e, _ in planned])
+    claimed = {item_id for item_id, won in claims if won}
     
-    # Search magazines
-    magazines = list(collections['magazines'].find({}, {'_id': 0}))
-    matched_magazines = [m for m in magazines if query_lower in m['title'].lower() or query_lower in m['author'].lower()]
+    for entry, result in planned:
+        if entry.item_id not in claimed:
+            result["error"] = "Item is not available"
+    planned = [(e, r) for e, r in planned if e.item_id in claimed]
     
-    # Search students
-    students = list(collections['students'].find({}, {'_id': 0}))
-    matched_students = [s for s in students if query_lower in s['name'].lower()]
+    # Give each person as many of their entries as their remaining quota
+    # allows, in request order, then count them under the max_borrow_limit guard
+    wanted = {}
+    over_limit = set()
+    for entry, result in planned:
+        _, person = people[entry.person_id]
+        remaining = person.get('max_borrow_limit', 5) - person.get('active_borrows', 0)
+        if wanted.get(entry.person_id, 0) < remaining:
+            wanted[entry.person_id] = wanted.get(entry.person_id, 0) + 1
+        else:
+            over_limit.add(result["index"])
     
-    # Search teachers
-    teachers = list(collections['teachers'].find({}, {'_id': 0}))
-    matched_teachers = [t for t in teachers if query_lower in t['name'].lower()]
+    async def claim_loans(person_id: str, count: int):
+        name, person = people[person_id]
+        granted = await collections[name].find_one_and_update(
+            {"id": person_id, "$expr": {"$lte": [
+                {"$add": [{"$ifNull": ["$active_borrows", 0]}, count]},
+                {"$ifNull": ["$max_borrow_limit", 5]}
+            ]}},
+            {"$inc": {"active_borrows": count}},
+            projection={'_id': 1}
+        )
+        entity_cache.invalidate(library_id, name, [person_id])
+        return person_id, granted is not None
     
-    return {
-        "books": matched_books,
-        "magazines": matched_magazines,
-        "students": matched_students,
-        "teachers": matched_teachers
+    granted = dict(await asyncio.gather(*[claim_loans(person_id, count) for person_id, count in wanted.items()]))
+    
+    released = []
+    for entry, result in planned:
+        if result["index"] in over_limit or not granted[entry.person_id]:
+            max_limit = people[entry.person_id][1].get('max_borrow_limit', 5)
+            result["error"] = f"Borrow limit reached ({max_limit} items)"
+            released.append(entry.item_id)
+    planned = [(e, r) for e, r in planned if r["index"] not in over_limit and granted[e.person_id]]
+    
+    # Create the borrow records in one round trip
+    borrow_date = datetime.now().strftime("%Y-%m-%d")
+    due_date = (datetime.now() + timedelta(days=14)).strftime("%Y-%m-%d")
+    records = []
+    for entry, result in planned:
+        person_name, person = people[entry.person_id]
+        item_name, item = items[entry.item_id]
+        records.append(BorrowRecord(
+            person_id=entry.person_id,
+            person_name=person['name'],
+            person_type=COLLECTION_TYPES[person_name],
+            item_id=entry.item_id,
+            item_title=item['title'],
+            item_type=COLLECTION_TYPES[item_name],
+            borrow_date=borrow_date,
+            due_date=due_date,
+            status="borrowed"
+        ).model_dump())
+    
+    try:
+        if records:
+            await collections['borrow_records'].insert_many([dict(record) for record in records], ordered=False)
+    except BaseException:
+        released.extend(e.item_id for e, _ in planned)
+        await asyncio.gather(*[
+            collections[people[person_id][0]].update_one({"id": person_id}, {"$inc": {"active_borrows": -count}})
+            for person_id, count in wanted.items() if granted[person_id]
+        ])
+        for person_id in wanted:
+            entity_cache.invalidate(library_id, people[person_id][0], [person_id])
+        planned = []
+        raise
+    finally:
+        # Hand back every item whose borrow did not go through
+        for name in ['books', 'magazines']:
+            ids = [item_id for item_id in released if items[item_id][0] == name]
+            if ids:
+                async with change_stamp() as stamp:
+                    await collections[name].update_many({"id": {"$in": ids}}, {"$set": {"available": True, "modified": stamp}})
+                entity_cache.invalidate(library_id, name, ids)
+    
+    borrowed = {'books': 0, 'magazines': 0}
+    for (entry, result), record in zip(planned, records):
+        result["status"] = "borrowed"
+        result["record"] = record
+        borrowed[items[entry.item_id][0]] += 1
+    await increment_stats(library_id, active_borrows=len(records),
+                          available_books=-borrowed['books'], available_magazines=-borrowed['magazines'])
+    
+    return {"borrowed": len(records), "failed": len(entries) - len(records), "results": results}
+
+@app.post("/api/library/{library_id}/return/bulk")
+async def bulk_return_items(library_id: str, entries: List[ReturnRequest]):
+    """Return many items at once, reporting success or failure per entry.
+
+    Records are read with one $in query and closed with the same guarded
+    update single returns use, all in flight at once; each update hands back
+    the record as it was, so the records this request closed, and whether
+    they were overdue, are known exactly. Items and loan counters are then
+    released in bulk.
+    """
+    check_bulk_size(entries)
+    collections = await get_collections(library_id)
+    results = [{"index": i, "record_id": e.record_id, "status": "failed"} for i, e in enumerate(entries)]
+    
+    record_ids = list({e.record_id for e in entries})
+    found = {record['id']: record async for record in collections['borrow_records'].find({"id": {"$in": record_ids}}, {'_id': 0})}
+    
+    # Close the records; the status filters keep concurrent returns from double-counting
+    return_date = datetime.now().strftime("%Y-%m-%d")
+    
+    async def close_record(record_id: str):
+        return await collections['borrow_records'].find_one_and_update(
+            {"id": record_id, "status": {"$in": ["borrowed", "overdue"]}},
+            {"$set": {"status": "returned", "return_date": return_date}},
+            projection={'_id': 0},
+            return_document=ReturnDocument.BEFORE
+        )
+    
+    closed = {
+        record['id']: (record['status'], record)
+        for record in await asyncio.gather(*[close_record(record_id) for record_id in record_ids]) if record
     }
+    
+    reported = set()
+    for entry, result in zip(entries, results):
+        if entry.record_id in closed and entry.record_id not in reported:
+            reported.add(entry.record_id)
+            result["status"] = "returned"
+        elif entry.record_id in found:
+            result["error"] = "Item already returned"
+        else:
+            result["error"] = "Borrow record not found"
+    
+    # Release items and loan counters in bulk
+    items = {'books': [], 'magazines': []}
+    loans = {'students': {}, 'teachers': {}}
+    for status, record in closed.values():
+        items[ENTITY_COLLECTIONS[record['item_type']]].append(record['item_id'])
+        if status == "borrowed":
+            person_loans = loans[ENTITY_COLLECTIONS[record['person_type']]]
+            person_loans[record['person_id']] = person_loans.get(record['person_id'], 0) + 1
+    for name, ids in items.items():
+        if ids:
+            async with change_stamp() as stamp:
+                await collections[name].update_many({"id": {"$in": ids}}, {"$set": {"available": True, "modified": stamp}})
+            entity_cache.invalidate(library_id, name, ids)
+    for name, counts in loans.items():
+        if counts:
+            await collections[name].bulk_write([
+                UpdateOne({"id": person_id}, {"$inc": {"active_borrows": -count}}) for person_id, count in counts.items()
+            ], ordered=False)
+            entity_cache.invalidate(library_id, name, counts)
+    
+    on_time = sum(1 for status, _ in closed.values() if status == "borrowed")
+    await increment_stats(library_id, active_borrows=-on_time, overdue_items=-(len(closed) - on_time),
+                          available_books=len(items['books']), available_magazines=len(items['magazines']))
+    
+    return {"returned": len(closed), "failed": len(entries) - len(closed), "results": results}
+
+@app.get("/api/library/{library_id}/borrow-records")
+async def get_borrow_records(library_id: str, request: Request, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, fields: Optional[str] = None):
+    """Get one page of borrow records (or all of them as NDJSON).
+
+    This is a pure read; the overdue sweeper keeps the status field current.
+    """
+    projection = build_projection(fields, BorrowRecord)
+    collections = await get_collections(library_id)
+    return await list_response(request, collections['borrow_records'], "records", limit, cursor, projection)
+
+# Budget for each search category; a slower category comes back empty instead of holding up the rest
+SEARCH_TIMEOUT_MS = int(os.environ.get('SEARCH_TIMEOUT_MS', 2000))
+
+async def search_collection(collection, query: str, limit: int, skip: int) -> List[Dict]:
+    """Rank one collection's matches through its text index, best match first"""
+    if not query:
+        cursor = collection.find({}, PUBLIC_PROJECTION).sort('_id', 1)
+    else:
+        score = {'$meta': 'textScore'}
+        cursor = collection.find({'$text': {'$search': query}}, {**PUBLIC_PROJECTION, 'score': score}).sort([('score', score)])
+    # maxTimeMS lets Mongo abandon the query too, not just this coroutine
+    docs = await cursor.skip(skip).limit(limit).max_time_ms(SEARCH_TIMEOUT_MS).to_list(length=limit)
+    for doc in docs:
+        doc.pop('score', None)
+    return docs
+
+async def search_with_timeout(collection, query: str, limit: int, skip: int) -> Optional[List[Dict]]:
+    """search_collection bounded by SEARCH_TIMEOUT_MS; None means it ran out of time"""
+    try:
+        return await asyncio.wait_for(search_collection(collection, query, limit, skip), SEARCH_TIMEOUT_MS / 1000)
+    except (asyncio.TimeoutError, ExecutionTimeout):
+        return None
+
+@app.get("/api/library/{library_id}/search")
+async def search_library(library_id: str, query: str = "", limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), page: int = Query(1, ge=1)):
+    """Search for items (title/author) or people (name) in the library.
+
+    Matching runs inside Mongo on the text indexes, so only up to `limit`
+    ranked results per type cross the wire; `page` walks further down the ranking.
+    The four categories are queried concurrently, so the response takes as long
+    as the slowest one, capped at SEARCH_TIMEOUT_MS; categories that ran out of
+    time are empty and listed in `timed_out`.
+    """
+    collections = await get_collections(library_id)
+    skip = (page - 1) * limit
+    categories = ['books', 'magazines', 'students', 'teachers']
+    
+    results = await asyncio.gather(*[
+        search_with_timeout(collections[name], query, limit, skip) for name in categories
+    ])
+    
+    response = {name: docs or [] for name, docs in zip(categories, results)}
+    response["timed_out"] = [name for name, docs in zip(categories, results) if docs is None]
+    response["page"] = page
+    return response
+
+@app.get("/api/library/{library_id}/autocomplete")
+async def autocomplete_library(library_id: str, prefix: str = "", limit: int = Query(10, ge=1, le=50)):
+    """Type-ahead suggestions over titles, authors and person names.
+
+    Served entirely from the in-process prefix index, no database round trip.
+    """
+    await get_collections(library_id)
+    return {"suggestions": get_index(library_id).search(prefix, limit)}
 
 # ==================== XML OPERATIONS ====================
 
 @app.get("/api/library/{library_id}/xml/export")
-async def export_library_xml(library_id: str):
-    """Export library data to XML format"""
-    collections = get_collections(library_id)
-    
-    data = {
-        'books': list(collections['books'].find({}, {'_id': 0})),
-        'magazines': list(collections['magazines'].find({}, {'_id': 0})),
-        'students': list(collections['students'].find({}, {'_id': 0})),
-        'teachers': list(collections['teachers'].find({}, {'_id': 0}))
+async def export_library_xml(library_id: str, compress: bool = False):
+    """Export library data as an XML file download, streamed straight from the Mongo cursors.
+
+    With compress=true the stream is gzip-compressed on the fly.
+    """
+    collections = await get_collections(library_id)
+    
+    sources = {
+        name: collections[name].find({}, {'_id': 0}).sort('_id', 1)
+        for name in ['books', 'magazines', 'students', 'teachers']
     }
+    body = iter_export_xml(library_id, sources)
+    filename = f"library_{library_id}_export.xml"
+    media_type = "application/xml"
+    if compress:
+        body = gzip_stream(body)
+        filename += ".gz"
+        media_type = "application/gzip"
     
-    xml_string = export_to_xml(library_id, data)
-    return {"xml": xml_string, "library_id": library_id}
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# Records per entity type buffered before each bulk upsert of a streamed import
+XML_IMPORT_BATCH_SIZE = int(os.environ.get('XML_IMPORT_BATCH_SIZE', 1000))
+
+def no_changes() -> Dict[str, int]:
+    return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+def add_changes(total: Dict[str, int], changes: Dict[str, int]):
+    for key, count in changes.items():
+        total[key] += count
+
+async def upsert_records(library_id: str, collection_name: str, records: List[Dict]) -> Dict[str, int]:
+    """Create-or-update imported records by id in one unordered bulk write.
+
+    Records whose content hash and availability match the stored document
+    are skipped, so re-importing the same data writes nothing. The library's
+    counters move by the difference from what was stored. Returns the
+    inserted/updated/unchanged counts.
+    """
+    changes = no_changes()
+    if not records:
+        return changes
+    collections = await get_collections(library_id)
+    collection = collections[collection_name]
+    stored = {
+        doc['id']: doc
+        async for doc in collection.find({"id": {"$in": [record['id'] for record in records]}},
+                                         {'_id': 0, 'id': 1, 'content_hash': 1, 'available': 1})
+    }
+    
+    changed, deltas = [], {}
+    for record in records:
+        record = {**record, "content_hash": content_hash(record)}
+        previous = stored.get(record['id'])
+        if is_unchanged(record, previous):
+            changes["unchanged"] += 1
+            continue
+        changes["inserted" if previous is None else "updated"] += 1
+        add_deltas(deltas, write_deltas(collection_name, record, previous))
+        stored[record['id']] = record
+        changed.append(record)
+    
+    if changed:
+        update = {"$setOnInsert": {"active_borrows": 0}} if collection_name in ('students', 'teachers') else {}
+        async with change_stamp() as stamp:
+            await collection.bulk_write([
+                UpdateOne({"id": record['id']}, {"$set": {**record, "modified": stamp}, **update}, upsert=True)
+                for record in changed
+            ], ordered=False)
+        await entities_saved(library_id, collection_name, changed)
+        await increment_stats(library_id, **deltas)
+    return changes
 
 @app.post("/api/library/{library_id}/xml/import")
 async def import_library_xml(library_id: str, xml_data: Dict = Body(...)):
@@ -381,39 +1020,10 @@ async def import_library_xml(library_id: str, xml_data: Dict = Body(...)):
     
     try:
         data = import_from_xml(xml_string)
-        collections = get_collections(library_id)
         
-        # Import books
-        for book in data['books']:
-            collections['books'].update_one(
-                {"id": book['id']},
-                {"$set": book},
-                upsert=True
-            )
-        
-        # Import magazines
-        for magazine in data['magazines']:
-            collections['magazines'].update_one(
-                {"id": magazine['id']},
-                {"$set": magazine},
-                upsert=True
-            )
-        
-        # Import students
-        for student in data['students']:
-            collections['students'].update_one(
-                {"id": student['id']},
-                {"$set": student},
-                upsert=True
-            )
-        
-        # Import teachers
-        for teacher in data['teachers']:
-            collections['teachers'].update_one(
-                {"id": teacher['id']},
-                {"$set": teacher},
-                upsert=True
-            )
+        changes = no_changes()
+        for name in ['books', 'magazines', 'students', 'teachers']:
+            add_changes(changes, await upsert_records(library_id, name, data[name]))
         
         return {
             "message": "XML imported successfully",
@@ -422,90 +1032,263 @@ async def import_library_xml(library_id: str, xml_data: Dict = Body(...)):
                 "magazines": len(data['magazines']),
                 "students": len(data['students']),
                 "teachers": len(data['teachers'])
-            }
+            },
+            **changes
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error importing XML: {str(e)}")
 
-@app.post("/api/library/xml/sync")
-async def sync_libraries(sync_data: Dict = Body(...)):
-    """Sync data between Library A and Library B"""
+XML_IMPORT_ERRORS = (ET.ParseError, ValueError, OSError, EOFError)
+
+async def import_xml_batches(library_id: str, fileobj, batch_size: int, skip: int = 0):
+    """Stream an XML export into a library, yielding (collection name, records, changes) after each bulk upsert.
+
+    Parsing happens in a worker thread. The first `skip` batches are parsed
+    but not written again, which is how an interrupted import job resumes.
+    """
+    position = 0
+    async for name, records in iterate_in_threadpool(iter_xml_batches(fileobj, batch_size)):
+        position += 1
+        if position <= skip:
+            continue
+        yield name, records, await upsert_records(library_id, name, records)
+
+@app.post("/api/library/{library_id}/xml/import/upload")
+async def upload_library_xml(library_id: str, file: UploadFile = File(...), batch_size: int = Query(XML_IMPORT_BATCH_SIZE, ge=1, le=MAX_BULK_CREATE_ROWS)):
+    """Import an uploaded XML export file (plain or gzipped) without loading it whole.
+
+    The file is parsed incrementally in a worker thread and upserted in
+    unordered bulk writes of batch_size records per entity type. Batches
+    written before a parse error stay imported; the error reports how far
+    the import got.
+    """
+    await get_collections(library_id)
+    imported = {"books": 0, "magazines": 0, "students": 0, "teachers": 0}
+    changes = no_changes()
+    
+    try:
+        async for name, records, batch_changes in import_xml_batches(library_id, file.file, batch_size):
+            imported[name] += len(records)
+            add_changes(changes, batch_changes)
+    except XML_IMPORT_ERRORS as e:
+        raise HTTPException(status_code=400, detail={"message": f"Error importing XML: {str(e)}", "imported": imported, **changes})
+    finally:
+        await file.close()
+    
+    return {"message": "XML imported successfully", "imported": imported, **changes}
+
+# Source documents copied per bulk upsert when syncing
+SYNC_BATCH_SIZE = int(os.environ.get('SYNC_BATCH_SIZE', 1000))
+SYNC_COLLECTIONS = ['books', 'magazines', 'students', 'teachers']
+# Deletes are replayed before upserts, so a re-created id ends up present
+SYNC_STEPS = ['tombstones'] + SYNC_COLLECTIONS
+
+async def sync_pair(sync_data: Dict):
+    """Validated (source, target) library ids of a sync request"""
     source_library = sync_data.get('source', 'a')
     target_library = sync_data.get('target', 'b')
     
-    if source_library not in ['a', 'b'] or target_library not in ['a', 'b']:
+    try:
+        await get_collections(source_library)
+        await get_collections(target_library)
+    except LibraryNotFound:
         raise HTTPException(status_code=400, detail="Invalid library IDs")
     
     if source_library == target_library:
         raise HTTPException(status_code=400, detail="Source and target libraries must be different")
+    return source_library, target_library
+
+async def apply_tombstones(target_library: str, tombstones: List[Dict]) -> int:
+    """Delete in the target whatever the source's tombstones name; returns how many were there"""
+    collections = await get_collections(target_library)
+    deleted = 0
+    for name in SYNC_COLLECTIONS:
+        ids = [tombstone['id'] for tombstone in tombstones if tombstone['collection'] == name]
+        if not ids:
+            continue
+        found = [doc async for doc in collections[name].find({"id": {"$in": ids}}, {'_id': 0, 'id': 1, 'available': 1})]
+        if not found:
+            continue
+        present = [doc['id'] for doc in found]
+        await collections[name].delete_many({"id": {"$in": present}})
+        deltas = {f"total_{name}": -len(present)}
+        if name in ('books', 'magazines'):
+            deltas[f"available_{name}"] = -sum(1 for doc in found if doc.get('available', True))
+        await increment_stats(target_library, **deltas)
+        entity_cache.invalidate(target_library, name, present)
+        for entity_id in present:
+            unindex_document(target_library, entity_id)
+            await unregister(target_library, entity_id)
+        await record_deletions(target_library, name, present)
+        deleted += len(present)
+    return deleted
+
+async def sync_batches(source_library: str, target_library: str, checkpoint: Optional[Dict] = None, full: bool = False):
+    """Copy what changed in a library since the last sync into another one, a keyset page at a time.
+
+    The window is (watermark, settled stamp]: deletes are replayed from the
+    source's tombstones first, then every document stamped after the
+    watermark is upserted. With full=True (or on the first sync of a pair)
+    everything is copied. Yields a checkpoint after every batch; passing
+    one back in continues right after that batch. The watermark only
+    advances once the whole window has been copied.
+    """
+    checkpoint = dict(checkpoint or {})
+    if 'high' not in checkpoint:
+        checkpoint['high'] = await settled_stamp()
+        checkpoint['low'] = 0 if full else await get_watermark(source_library, target_library)
+    synced = dict(checkpoint.get('synced') or {**{name: 0 for name in SYNC_COLLECTIONS}, 'deleted': 0})
+    changes = dict(checkpoint.get('changes') or no_changes())
+    source_collections = await get_collections(source_library)
+    changed = {'modified': {'$gt': checkpoint['low']}} if checkpoint['low'] else {}
+    cursor = checkpoint.get('cursor')
     
-    # Export from source
-    source_collections = get_collections(source_library)
-    data = {
-        'books': list(source_collections['books'].find({}, {'_id': 0})),
-        'magazines': list(source_collections['magazines'].find({}, {'_id': 0})),
-        'students': list(source_collections['students'].find({}, {'_id': 0})),
-        'teachers': list(source_collections['teachers'].find({}, {'_id': 0}))
-    }
-    
-    # Import to target
-    target_collections = get_collections(target_library)
-    
-    for book in data['books']:
-        target_collections['books'].update_one(
-            {"id": book['id']},
-            {"$set": book},
-            upsert=True
-        )
-    
-    for magazine in data['magazines']:
-        target_collections['magazines'].update_one(
-            {"id": magazine['id']},
-            {"$set": magazine},
-            upsert=True
-        )
+    for position in range(checkpoint.get('collection', 0), len(SYNC_STEPS)):
+        name = SYNC_STEPS[position]
+        # Loan counters belong to the source library, so they stay behind
+        projection = {'_id': 0, 'active_borrows': 0} if name in ('students', 'teachers') else {'_id': 0}
+        while True:
+            docs, cursor = await fetch_page(source_collections[name], changed, projection, SYNC_BATCH_SIZE, cursor)
+            if name == 'tombstones':
+                synced['deleted'] += await apply_tombstones(target_library, docs)
+            else:
+                add_changes(changes, await upsert_records(target_library, name, docs))
+                synced[name] += len(docs)
+            if cursor is None:
+                break
+            yield {**checkpoint, 'collection': position, 'cursor': cursor, 'synced': synced, 'changes': changes}
+        yield {**checkpoint, 'collection': position + 1, 'cursor': None, 'synced': synced, 'changes': changes}
     
-    for student in data['students']:
-        target_collections['students'].update_one(
-            {"id": student['id']},
-            {"$set": student},
-            upsert=True
-        )
+    await set_watermark(source_library, target_library, checkpoint['high'])
+
+@app.post("/api/library/xml/sync")
+async def sync_libraries(sync_data: Dict = Body(...)):
+    """Sync data between Library A and Library B.
+
+    Only changes since the previous sync of the same pair are sent; pass
+    "full": true to copy everything again.
+    """
+    source_library, target_library = await sync_pair(sync_data)
     
-    for teacher in data['teachers']:
-        target_collections['teachers'].update_one(
-            {"id": teacher['id']},
-            {"$set": teacher},
-            upsert=True
-        )
+    synced, changes = {}, no_changes()
+    async for checkpoint in sync_batches(source_library, target_library, full=bool(sync_data.get('full', False))):
+        synced, changes = checkpoint['synced'], checkpoint['changes']
     
     return {
         "message": f"Successfully synced Library {source_library.upper()} to Library {target_library.upper()}",
-        "synced": {
-            "books": len(data['books']),
-            "magazines": len(data['magazines']),
-            "students": len(data['students']),
-            "teachers": len(data['teachers'])
-        }
+        "synced": synced,
+        **changes
     }
 
+# ==================== BACKGROUND JOBS ====================
+
+@job_handler('xml_import')
+async def run_import_job(job: Job) -> Dict:
+    """Import a spooled XML upload, committing a checkpoint after every batch"""
+    library_id = job.params['library_id']
+    path = job.params['path']
+    imported = dict(job.checkpoint.get('imported') or {"books": 0, "magazines": 0, "students": 0, "teachers": 0})
+    changes = dict(job.checkpoint.get('changes') or no_changes())
+    position = job.checkpoint.get('batches', 0)
+    size = os.path.getsize(path)
+    
+    with open(path, 'rb') as fileobj:
+        async for name, records, batch_changes in import_xml_batches(library_id, fileobj, job.params['batch_size'], skip=position):
+            position += 1
+            imported[name] += len(records)
+            add_changes(changes, batch_changes)
+            # How far into the (possibly gzipped) file the parser has read
+            progress = min(fileobj.tell() / size, 1.0) if size else None
+            await job.commit({'batches': position, 'imported': imported, 'changes': changes}, sum(imported.values()), progress)
+    return {"imported": imported, **changes}
+
+@job_handler('sync')
+async def run_sync_job(job: Job) -> Dict:
+    """Sync two libraries, committing the page cursor after every batch"""
+    source_library = job.params['source']
+    target_library = job.params['target']
+    source_collections = await get_collections(source_library)
+    low = job.checkpoint['low'] if 'low' in job.checkpoint else (0 if job.params.get('full') else await get_watermark(source_library, target_library))
+    changed = {'modified': {'$gt': low}} if low else {}
+    total = sum([await source_collections[name].count_documents(changed) for name in SYNC_STEPS])
+    
+    synced = job.checkpoint.get('synced') or {}
+    changes = job.checkpoint.get('changes') or no_changes()
+    async for checkpoint in sync_batches(source_library, target_library, job.checkpoint, full=job.params.get('full', False)):
+        synced, changes = checkpoint['synced'], checkpoint['changes']
+        processed = sum(synced.values())
+        await job.commit(checkpoint, processed, min(processed / total, 1.0) if total else None)
+    return {"synced": synced, **changes}
+
+def job_or_404(doc: Optional[Dict]) -> Dict:
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job": describe_job(doc)}
+
+@app.post("/api/library/{library_id}/xml/import/jobs")
+async def submit_import_job(library_id: str, file: UploadFile = File(...), batch_size: int = Query(XML_IMPORT_BATCH_SIZE, ge=1, le=MAX_BULK_CREATE_ROWS)):
+    """Queue an XML upload for import in the background; poll GET /api/jobs/{id} for progress"""
+    await get_collections(library_id)
+    try:
+        job = await submit_job('xml_import', {'library_id': library_id, 'batch_size': batch_size}, upload=file.file)
+    finally:
+        await file.close()
+    return job_or_404(job)
+
+@app.post("/api/library/xml/sync/jobs")
+async def submit_sync_job(sync_data: Dict = Body(...)):
+    """Queue a library sync in the background; poll GET /api/jobs/{id} for progress"""
+    source_library, target_library = await sync_pair(sync_data)
+    params = {'source': source_library, 'target': target_library, 'full': bool(sync_data.get('full', False))}
+    return job_or_404(await submit_job('sync', params))
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status, records processed, rate and ETA of a background job"""
+    return job_or_404(await jobs.find_one({'_id': job_id}))
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_background_job(job_id: str):
+    """Cancel a queued job, or stop a running one after its current batch"""
+    return job_or_404(await cancel_job(job_id))
+
 @app.get("/api/library/{library_id}/stats")
 async def get_library_stats(library_id: str):
-    """Get statistics for a library"""
-    collections = get_collections(library_id)
-    
-    stats = {
-        "total_books": collections['books'].count_documents({}),
-        "available_books": collections['books'].count_documents({"available": True}),
-        "total_magazines": collections['magazines'].count_documents({}),
-        "available_magazines": collections['magazines'].count_documents({"available": True}),
-        "total_students": collections['students'].count_documents({}),
-        "total_teachers": collections['teachers'].count_documents({}),
-        "active_borrows": collections['borrow_records'].count_documents({"status": "borrowed"}),
-        "overdue_items": collections['borrow_records'].count_documents({"status": "overdue"})
-    }
-    
-    return stats
+    """Get statistics for a library from its maintained counters document"""
+    await get_collections(library_id)
+    return await read_stats(library_id)
+
+# ==================== ADMIN ====================
+
+@app.get("/api/admin/library/{library_id}/indexes")
+async def get_library_indexes(library_id: str):
+    """Report index usage statistics for a library's collections"""
+    await get_collections(library_id)
+    return {"library_id": library_id, "indexes": await get_index_stats(library_id)}
+
+@app.post("/api/admin/library/{library_id}/stats/reconcile")
+async def reconcile_library_stats(library_id: str):
+    """Recount a library's statistics and per-person loan counters from scratch"""
+    await get_collections(library_id)
+    stats = await reconcile_stats(library_id)
+    people_with_loans = await reconcile_active_borrows(library_id)
+    return {"library_id": library_id, "stats": stats, "people_with_active_borrows": people_with_loans}
+
+@app.get("/api/admin/entity-cache")
+async def get_entity_cache_stats():
+    """Hit, miss, eviction and invalidation counts of the single-entity GET cache"""
+    return entity_cache.stats()
+
+@app.get("/api/admin/overdue-sweeper")
+async def get_sweeper_metrics():
+    """How often the overdue sweeper ran and how many records it transitioned"""
+    return sweep_metrics
+
+@app.post("/api/admin/overdue-sweeper/run")
+async def run_overdue_sweep():
+    """Sweep every library now instead of waiting for the next interval"""
+    await sweep_all()
+    return sweep_metrics
 
 if __name__ == "__main__":
     import uvicorn
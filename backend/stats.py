@@ -0,0 +1,107 @@
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+
+from cache import entity_cache
+from database import LazyCollection, get_collections
+
+# One document per library ({'_id': library_id, <counter>: n, ...}) kept current with $inc
+library_stats = LazyCollection('library_stats')
+
+STAT_FIELDS = [
+    'total_books',
+    'available_books',
+    'total_magazines',
+    'available_magazines',
+    'total_students',
+    'total_teachers',
+    'active_borrows',
+    'overdue_items',
+]
+
+async def increment_stats(library_id: str, **deltas: int):
+    """Atomically apply counter deltas, e.g. increment_stats('a', total_books=1)"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        await library_stats.update_one({'_id': library_id}, {'$inc': deltas}, upsert=True)
+
+def write_deltas(collection_name: str, doc: Dict, previous: Optional[Dict]) -> Dict[str, int]:
+    """Counter deltas for writing doc over the stored previous version (None when the id is new)"""
+    deltas = {f"total_{collection_name}": int(previous is None)}
+    if collection_name in ('books', 'magazines'):
+        was_available = int(previous.get('available', True)) if previous is not None else 0
+        deltas[f"available_{collection_name}"] = int(doc.get('available', True)) - was_available
+    return deltas
+
+def add_deltas(total: Dict[str, int], deltas: Dict[str, int]):
+    for field, delta in deltas.items():
+        total[field] = total.get(field, 0) + delta
+
+async def count_stats(library_id: str) -> Dict[str, int]:
+    """Recompute every counter from the collections themselves (the slow path)"""
+    collections = await get_collections(library_id)
+    return {
+        "total_books": await collections['books'].count_documents({}),
+        "available_books": await collections['books'].count_documents({"available": True}),
+        "total_magazines": await collections['magazines'].count_documents({}),
+        "available_magazines": await collections['magazines'].count_documents({"available": True}),
+        "total_students": await collections['students'].count_documents({}),
+        "total_teachers": await collections['teachers'].count_documents({}),
+        "active_borrows": await collections['borrow_records'].count_documents({"status": "borrowed"}),
+        "overdue_items": await collections['borrow_records'].count_documents({"status": "overdue"})
+    }
+
+async def reconcile_stats(library_id: str) -> Dict[str, int]:
+    """Repair the counters document from a full recount and return the fresh values"""
+    stats = await count_stats(library_id)
+    await library_stats.update_one({'_id': library_id}, {'$set': stats}, upsert=True)
+    return stats
+
+async def ensure_stats(library_id: str):
+    """Seed the counters document from a recount when it is missing or lacks a counter.
+
+    Runs at startup and when a library is created, before the sweeper or a
+    request can $inc a partial document into existence.
+    """
+    complete = {field: {'$exists': True} for field in STAT_FIELDS}
+    if await library_stats.find_one({'_id': library_id, **complete}, {'_id': 1}) is None:
+        await reconcile_stats(library_id)
+
+async def read_stats(library_id: str) -> Dict[str, int]:
+    """Current counters in a single read, seeding them on first use"""
+    doc = await library_stats.find_one({'_id': library_id})
+    if doc is None:
+        return await reconcile_stats(library_id)
+    return {field: doc.get(field, 0) for field in STAT_FIELDS}
+
+async def reconcile_active_borrows(library_id: str) -> int:
+    """Recompute every student's and teacher's active_borrows from the borrow records.
+
+    Returns how many people currently have at least one active loan.
+    """
+    collections = await get_collections(library_id)
+    counts = {
+        (group['_id']['person_type'], group['_id']['person_id']): group['count']
+        async for group in collections['borrow_records'].aggregate([
+            {'$match': {'status': 'borrowed'}},
+            {'$group': {'_id': {'person_id': '$person_id', 'person_type': '$person_type'}, 'count': {'$sum': 1}}},
+        ])
+    }
+    for person_type, name in [('student', 'students'), ('teacher', 'teachers')]:
+        await collections[name].update_many({}, {'$set': {'active_borrows': 0}})
+        operations = [
+            UpdateOne({'id': person_id}, {'$set': {'active_borrows': count}})
+            for (kind, person_id), count in counts.items() if kind == person_type
+        ]
+        if operations:
+            await collections[name].bulk_write(operations, ordered=False)
+        entity_cache.invalidate_collection(library_id, name)
+    return len(counts)
+
+async def ensure_active_borrows(library_id: str):
+    """Backfill active_borrows once for data written before the counter existed"""
+    collections = await get_collections(library_id)
+    for name in ['students', 'teachers']:
+        if await collections[name].find_one({'active_borrows': {'$exists': False}}, {'_id': 1}):
+            await reconcile_active_borrows(library_id)
+            return
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from cache import entity_cache
+from database import get_collections, library_ids
+from registry import ENTITY_COLLECTIONS
+from stats import increment_stats, reconcile_active_borrows, reconcile_stats
+
+logger = logging.getLogger(__name__)
+
+# Seconds between overdue sweeps
+SWEEP_INTERVAL = int(os.environ.get('OVERDUE_SWEEP_INTERVAL', 300))
+# A sweep tag older than this belongs to a sweep that died before finishing
+STALE_SWEEP_SECONDS = int(os.environ.get('OVERDUE_STALE_SWEEP_SECONDS', 60))
+
+sweep_metrics = {
+    "interval_seconds": SWEEP_INTERVAL,
+    "runs": 0,
+    "failures": 0,
+    "last_run": None,
+    "last_duration_ms": None,
+    "last_transitioned": {},
+    "total_transitioned": 0,
+    "repaired_sweeps": 0,
+}
+
+def sweep_token() -> str:
+    """A per-sweep tag that records when the sweep started"""
+    return f"{int(time.time())}:{uuid.uuid4()}"
+
+def sweep_started(token: str) -> int:
+    """When the sweep that issued a token started; 0 for tags written before tokens carried it"""
+    started, _, _ = token.partition(':')
+    return int(started) if started.isdigit() else 0
+
+async def repair_stranded_sweeps(library_id: str) -> int:
+    """Finish the bookkeeping of sweeps that flipped records to overdue but died before settling them.
+
+    Such records still carry their sweep's tag (found through the sparse
+    overdue_sweep index), and their loans were never taken off the people's
+    active_borrows or moved in the stats. Both are recounted from the
+    records, which is idempotent, and the stale tags are removed. Returns
+    how many stranded sweeps were found.
+    """
+    collections = await get_collections(library_id)
+    cutoff = time.time() - STALE_SWEEP_SECONDS
+    tokens = await collections['borrow_records'].distinct('overdue_sweep', {'overdue_sweep': {'$exists': True}})
+    stale = [token for token in tokens if sweep_started(token) < cutoff]
+    if not stale:
+        return 0
+    await reconcile_active_borrows(library_id)
+    await reconcile_stats(library_id)
+    await collections['borrow_records'].update_many({'overdue_sweep': {'$in': stale}}, {'$unset': {'overdue_sweep': ''}})
+    logger.warning("Repaired %d interrupted overdue sweep(s) in library %s", len(stale), library_id)
+    sweep_metrics["repaired_sweeps"] += len(stale)
+    return len(stale)
+
+async def sweep_library(library_id: str) -> int:
+    """Flip every borrowed record past its due date to overdue with one indexed update_many.
+
+    The records are tagged with a per-sweep token so the loans this sweep
+    actually moved can be grouped per person and taken off their
+    active_borrows counters, without racing concurrent returns. Tags left
+    by an earlier sweep that failed part way are repaired first.
+    """
+    await repair_stranded_sweeps(library_id)
+    collections = await get_collections(library_id)
+    today = datetime.now().strftime("%Y-%m-%d")
+    token = sweep_token()
+    result = await collections['borrow_records'].update_many(
+        {"status": "borrowed", "due_date": {"$lt": today}},
+        {"$set": {"status": "overdue", "overdue_sweep": token}}
+    )
+    transitioned = result.modified_count
+    if not transitioned:
+        return 0
+    
+    # Matched by token alone, so loans returned since the update_many are still counted
+    swept = {"overdue_sweep": token}
+    loans = {}
+    async for group in collections['borrow_records'].aggregate([
+        {"$match": swept},
+        {"$group": {"_id": {"person_id": "$person_id", "person_type": "$person_type"}, "count": {"$sum": 1}}},
+    ]):
+        name = ENTITY_COLLECTIONS[group['_id']['person_type']]
+        loans.setdefault(name, {})[group['_id']['person_id']] = group['count']
+    for name, counts in loans.items():
+        await collections[name].bulk_write([
+            UpdateOne({"id": person_id}, {"$inc": {"active_borrows": -count}}) for person_id, count in counts.items()
+        ], ordered=False)
+        entity_cache.invalidate(library_id, name, counts)
+    await collections['borrow_records'].update_many(swept, {"$unset": {"overdue_sweep": ""}})
+    
+    await increment_stats(library_id, active_borrows=-transitioned, overdue_items=transitioned)
+    return transitioned
+
+async def sweep_all():
+    """One sweep over every library, recorded in sweep_metrics"""
+    started = time.perf_counter()
+    transitioned = {}
+    for library_id in await library_ids():
+        transitioned[library_id] = await sweep_library(library_id)
+    sweep_metrics["runs"] += 1
+    sweep_metrics["last_run"] = datetime.now().isoformat()
+    sweep_metrics["last_duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    sweep_metrics["last_transitioned"] = transitioned
+    sweep_metrics["total_transitioned"] += sum(transitioned.values())
+
+async def run_sweeper():
+    """Sweep immediately, then every SWEEP_INTERVAL seconds until cancelled"""
+    while True:
+        try:
+            await sweep_all()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            sweep_metrics["failures"] += 1
+            logger.exception("Overdue sweep failed")
+        await asyncio.sleep(SWEEP_INTERVAL)
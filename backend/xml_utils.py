@@ -1,148 +1,225 @@
+import gzip
 import xml.etree.ElementTree as ET
-from typing import List, Dict
+import zlib
+from typing import Any, AsyncIterable, AsyncIterator, BinaryIO, Iterator, List, Dict, Optional, Tuple
 from datetime import datetime
 
+# Element text <-> field value for each field type: (parse, format)
+FIELD_TYPES = {
+    str: (str, str),
+    int: (int, str),
+    bool: (lambda text: text == 'true', lambda value: str(value).lower()),
+}
+
+class RecordSchema:
+    """Declarative mapping between one entity type and its XML record element.
+
+    `fields` is a list of (element tag, field, type, default) in document
+    order, `attributes` a list of (attribute, field, default) and
+    `constants` fields every imported record gets regardless of the XML.
+    A missing or empty element reads back as its default.
+    """
+
+    def __init__(self, tag: str, fields: List[Tuple[str, str, type, Any]],
+                 attributes: List[Tuple[str, str, str]] = (), constants: Optional[Dict] = None):
+        self.tag = tag
+        self.fields = fields
+        self.attributes = attributes
+        self.defaults = {field: default for _, field, _, default in fields}
+        self.defaults.update({field: default for _, field, default in attributes})
+        self.defaults.update(constants or {})
+        # tag -> (field, parse) so each child element costs one dict lookup
+        self.parsers = {tag: (field, FIELD_TYPES[kind][0]) for tag, field, kind, _ in fields}
+
+    def to_element(self, doc: Dict) -> ET.Element:
+        """Build the record element for one document"""
+        elem = ET.Element(self.tag)
+        for attribute, field, default in self.attributes:
+            elem.set(attribute, doc.get(field, default))
+        for tag, field, kind, default in self.fields:
+            value = doc.get(field, default)
+            ET.SubElement(elem, tag).text = None if value is None else FIELD_TYPES[kind][1](value)
+        return elem
+
+    def from_element(self, elem: ET.Element) -> Dict:
+        """Read one document back out of its record element, visiting each child once"""
+        record = dict(self.defaults)
+        for attribute, field, default in self.attributes:
+            record[field] = elem.get(attribute, default)
+        parsers = self.parsers
+        for child in elem:
+            parser = parsers.get(child.tag)
+            if parser is not None and child.text:
+                field, parse = parser
+                record[field] = parse(child.text)
+        return record
+
+BOOK_SCHEMA = RecordSchema('Book', [
+    ('ID', 'id', str, ''),
+    ('Title', 'title', str, ''),
+    ('Author', 'author', str, ''),
+    ('ISBN', 'isbn', str, ''),
+    ('Available', 'available', bool, True),
+    ('Pages', 'pages', int, 0),
+    ('Publisher', 'publisher', str, ''),
+], attributes=[('type', 'genre', 'General')], constants={'item_type': 'book'})
+
+MAGAZINE_SCHEMA = RecordSchema('Magazine', [
+    ('ID', 'id', str, ''),
+    ('Title', 'title', str, ''),
+    ('Author', 'author', str, ''),
+    ('ISBN', 'isbn', str, ''),
+    ('Available', 'available', bool, True),
+    ('IssueNumber', 'issue_number', str, ''),
+    ('PublicationMonth', 'publication_month', str, ''),
+], constants={'item_type': 'magazine'})
+
+STUDENT_SCHEMA = RecordSchema('Student', [
+    ('ID', 'id', str, ''),
+    ('Name', 'name', str, ''),
+    ('Email', 'email', str, ''),
+    ('Phone', 'phone', str, ''),
+    ('StudentID', 'student_id', str, ''),
+    ('GradeLevel', 'grade_level', str, ''),
+    ('MaxBorrowLimit', 'max_borrow_limit', int, 5),
+], constants={'person_type': 'student'})
+
+TEACHER_SCHEMA = RecordSchema('Teacher', [
+    ('ID', 'id', str, ''),
+    ('Name', 'name', str, ''),
+    ('Email', 'email', str, ''),
+    ('Phone', 'phone', str, ''),
+    ('TeacherID', 'teacher_id', str, ''),
+    ('Department', 'department', str, ''),
+    ('MaxBorrowLimit', 'max_borrow_limit', int, 10),
+], constants={'person_type': 'teacher'})
+
+# (data key, section tag, schema) in document order, shared by import and export
+SECTIONS = [
+    ('books', 'Books', BOOK_SCHEMA),
+    ('magazines', 'Magazines', MAGAZINE_SCHEMA),
+    ('students', 'Students', STUDENT_SCHEMA),
+    ('teachers', 'Teachers', TEACHER_SCHEMA),
+]
+SECTION_SCHEMAS = {section: (key, schema) for key, section, schema in SECTIONS}
+
 def export_to_xml(library_id: str, data: Dict) -> str:
     """Export library data to XML format"""
     root = ET.Element('LibraryCatalog')
     root.set('library', f'Library_{library_id.upper()}')
     root.set('export_date', datetime.now().isoformat())
     
-    # Export Books
-    books_elem = ET.SubElement(root, 'Books')
-    for book in data.get('books', []):
-        book_elem = ET.SubElement(books_elem, 'Book')
-        book_elem.set('type', book.get('genre', 'General'))
-        
-        ET.SubElement(book_elem, 'ID').text = book['id']
-        ET.SubElement(book_elem, 'Title').text = book['title']
-        ET.SubElement(book_elem, 'Author').text = book['author']
-        ET.SubElement(book_elem, 'ISBN').text = book['isbn']
-        ET.SubElement(book_elem, 'Available').text = str(book['available']).lower()
-        ET.SubElement(book_elem, 'Pages').text = str(book.get('pages', 0))
-        ET.SubElement(book_elem, 'Publisher').text = book.get('publisher', '')
-    
-    # Export Magazines
-    magazines_elem = ET.SubElement(root, 'Magazines')
-    for magazine in data.get('magazines', []):
-        mag_elem = ET.SubElement(magazines_elem, 'Magazine')
-        
-        ET.SubElement(mag_elem, 'ID').text = magazine['id']
-        ET.SubElement(mag_elem, 'Title').text = magazine['title']
-        ET.SubElement(mag_elem, 'Author').text = magazine['author']
-        ET.SubElement(mag_elem, 'ISBN').text = magazine['isbn']
-        ET.SubElement(mag_elem, 'Available').text = str(magazine['available']).lower()
-        ET.SubElement(mag_elem, 'IssueNumber').text = magazine.get('issue_number', '')
-        ET.SubElement(mag_elem, 'PublicationMonth').text = magazine.get('publication_month', '')
-    
-    # Export Students
-    students_elem = ET.SubElement(root, 'Students')
-    for student in data.get('students', []):
-        student_elem = ET.SubElement(students_elem, 'Student')
-        
-        ET.SubElement(student_elem, 'ID').text = student['id']
-        ET.SubElement(student_elem, 'Name').text = student['name']
-        ET.SubElement(student_elem, 'Email').text = student['email']
-        ET.SubElement(student_elem, 'Phone').text = student['phone']
-        ET.SubElement(student_elem, 'StudentID').text = student['student_id']
-        ET.SubElement(student_elem, 'GradeLevel').text = student['grade_level']
-        ET.SubElement(student_elem, 'MaxBorrowLimit').text = str(student.get('max_borrow_limit', 5))
-    
-    # Export Teachers
-    teachers_elem = ET.SubElement(root, 'Teachers')
-    for teacher in data.get('teachers', []):
-        teacher_elem = ET.SubElement(teachers_elem, 'Teacher')
-        
-        ET.SubElement(teacher_elem, 'ID').text = teacher['id']
-        ET.SubElement(teacher_elem, 'Name').text = teacher['name']
-        ET.SubElement(teacher_elem, 'Email').text = teacher['email']
-        ET.SubElement(teacher_elem, 'Phone').text = teacher['phone']
-        ET.SubElement(teacher_elem, 'TeacherID').text = teacher['teacher_id']
-        ET.SubElement(teacher_elem, 'Department').text = teacher['department']
-        ET.SubElement(teacher_elem, 'MaxBorrowLimit').text = str(teacher.get('max_borrow_limit', 10))
+    for key, section, schema in SECTIONS:
+        section_elem = ET.SubElement(root, section)
+        for record in data.get(key, []):
+            section_elem.append(schema.to_element(record))
     
     # Convert to string with pretty formatting
     ET.indent(root, space="  ")
     return ET.tostring(root, encoding='unicode', method='xml')
 
+# Serialized records buffered before each yield of the streaming export
+STREAM_CHUNK_SIZE = 64 * 1024
+
+async def iter_export_xml(library_id: str, sources: Dict[str, AsyncIterable[Dict]]) -> AsyncIterator[str]:
+    """Stream the same document export_to_xml builds, one record element at a time.
+
+    `sources` maps each data key to an async iterable of records (a Mongo
+    cursor in practice). Only the current record's element and one output
+    chunk are ever held in memory.
+    """
+    root = ET.Element('LibraryCatalog')
+    root.set('library', f'Library_{library_id.upper()}')
+    root.set('export_date', datetime.now().isoformat())
+    # Serialize the empty root and split it to get a properly escaped opening tag
+    opening = ET.tostring(root, encoding='unicode').replace(' />', '>')
+    
+    buffer = [opening, '\n']
+    size = 0
+    for key, section, schema in SECTIONS:
+        buffer.append(f'  <{section}>\n')
+        async for record in sources[key]:
+            record_elem = schema.to_element(record)
+            ET.indent(record_elem, space="  ", level=2)
+            text = ET.tostring(record_elem, encoding='unicode')
+            buffer.append(f'    {text}\n')
+            size += len(text)
+            if size >= STREAM_CHUNK_SIZE:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+        buffer.append(f'  </{section}>\n')
+    buffer.append('</LibraryCatalog>\n')
+    yield ''.join(buffer)
+
+async def gzip_stream(chunks: AsyncIterable[str]) -> AsyncIterator[bytes]:
+    """Gzip-compress a stream of text chunks on the fly"""
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk.encode('utf-8'))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
 def import_from_xml(xml_string: str) -> Dict:
     """Import library data from XML format"""
     root = ET.fromstring(xml_string)
     
-    data = {
-        'books': [],
-        'magazines': [],
-        'students': [],
-        'teachers': []
-    }
-    
-    # Import Books
-    books_elem = root.find('Books')
-    if books_elem is not None:
-        for book_elem in books_elem.findall('Book'):
-            book = {
-                'id': book_elem.find('ID').text if book_elem.find('ID') is not None else '',
-                'title': book_elem.find('Title').text if book_elem.find('Title') is not None else '',
-                'author': book_elem.find('Author').text if book_elem.find('Author') is not None else '',
-                'isbn': book_elem.find('ISBN').text if book_elem.find('ISBN') is not None else '',
-                'available': book_elem.find('Available').text == 'true' if book_elem.find('Available') is not None else True,
-                'genre': book_elem.get('type', 'General'),
-                'pages': int(book_elem.find('Pages').text) if book_elem.find('Pages') is not None and book_elem.find('Pages').text else 0,
-                'publisher': book_elem.find('Publisher').text if book_elem.find('Publisher') is not None else '',
-                'item_type': 'book'
-            }
-            data['books'].append(book)
-    
-    # Import Magazines
-    magazines_elem = root.find('Magazines')
-    if magazines_elem is not None:
-        for mag_elem in magazines_elem.findall('Magazine'):
-            magazine = {
-                'id': mag_elem.find('ID').text if mag_elem.find('ID') is not None else '',
-                'title': mag_elem.find('Title').text if mag_elem.find('Title') is not None else '',
-                'author': mag_elem.find('Author').text if mag_elem.find('Author') is not None else '',
-                'isbn': mag_elem.find('ISBN').text if mag_elem.find('ISBN') is not None else '',
-                'available': mag_elem.find('Available').text == 'true' if mag_elem.find('Available') is not None else True,
-                'issue_number': mag_elem.find('IssueNumber').text if mag_elem.find('IssueNumber') is not None else '',
-                'publication_month': mag_elem.find('PublicationMonth').text if mag_elem.find('PublicationMonth') is not None else '',
-                'item_type': 'magazine'
-            }
-            data['magazines'].append(magazine)
-    
-    # Import Students
-    students_elem = root.find('Students')
-    if students_elem is not None:
-        for student_elem in students_elem.findall('Student'):
-            student = {
-                'id': student_elem.find('ID').text if student_elem.find('ID') is not None else '',
-                'name': student_elem.find('Name').text if student_elem.find('Name') is not None else '',
-                'email': student_elem.find('Email').text if student_elem.find('Email') is not None else '',
-                'phone': student_elem.find('Phone').text if student_elem.find('Phone') is not None else '',
-                'student_id': student_elem.find('StudentID').text if student_elem.find('StudentID') is not None else '',
-                'grade_level': student_elem.find('GradeLevel').text if student_elem.find('GradeLevel') is not None else '',
-                'max_borrow_limit': int(student_elem.find('MaxBorrowLimit').text) if student_elem.find('MaxBorrowLimit') is not None and student_elem.find('MaxBorrowLimit').text else 5,
-                'person_type': 'student'
-            }
-            data['students'].append(student)
-    
-    # Import Teachers
-    teachers_elem = root.find('Teachers')
-    if teachers_elem is not None:
-        for teacher_elem in teachers_elem.findall('Teacher'):
-            teacher = {
-                'id': teacher_elem.find('ID').text if teacher_elem.find('ID') is not None else '',
-                'name': teacher_elem.find('Name').text if teacher_elem.find('Name') is not None else '',
-                'email': teacher_elem.find('Email').text if teacher_elem.find('Email') is not None else '',
-                'phone': teacher_elem.find('Phone').text if teacher_elem.find('Phone') is not None else '',
-                'teacher_id': teacher_elem.find('TeacherID').text if teacher_elem.find('TeacherID') is not None else '',
-                'department': teacher_elem.find('Department').text if teacher_elem.find('Department') is not None else '',
-                'max_borrow_limit': int(teacher_elem.find('MaxBorrowLimit').text) if teacher_elem.find('MaxBorrowLimit') is not None and teacher_elem.find('MaxBorrowLimit').text else 10,
-                'person_type': 'teacher'
-            }
-            data['teachers'].append(teacher)
+    data = {key: [] for key, _, _ in SECTIONS}
+    for key, section, schema in SECTIONS:
+        section_elem = root.find(section)
+        if section_elem is not None:
+            data[key].extend(schema.from_element(record_elem) for record_elem in section_elem.findall(schema.tag))
     
     return data
 
+GZIP_MAGIC = b'\x1f\x8b'
+
+def open_xml_upload(fileobj: BinaryIO) -> BinaryIO:
+    """The upload as a readable byte stream, transparently gunzipped if it is gzip"""
+    head = fileobj.read(2)
+    fileobj.seek(0)
+    if head == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    return fileobj
+
+def iter_xml_batches(fileobj: BinaryIO, batch_size: int) -> Iterator[Tuple[str, List[Dict]]]:
+    """Incrementally parse an export, yielding (data key, records) batches of up to batch_size.
+
+    Each record element is parsed as soon as it closes and then dropped
+    from its section, so memory stays bounded by the batch size no
+    matter how large the document is. Raises ValueError if the root is
+    not a LibraryCatalog and ET.ParseError on malformed XML.
+    """
+    batches = {key: [] for key, _, _ in SECTIONS}
+    depth = 0
+    section = None
+    for event, elem in ET.iterparse(open_xml_upload(fileobj), events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 1 and elem.tag != 'LibraryCatalog':
+                raise ValueError("Invalid XML format")
+            elif depth == 2:
+                section = elem
+            continue
+        
+        depth -= 1
+        if depth == 2 and section.tag in SECTION_SCHEMAS:
+            key, schema = SECTION_SCHEMAS[section.tag]
+            if elem.tag == schema.tag:
+                batch = batches[key]
+                batch.append(schema.from_element(elem))
+                if len(batch) >= batch_size:
+                    yield key, batch
+                    batches[key] = []
+            section.clear()
+        elif depth == 1:
+            elem.clear()
+    
+    for key, batch in batches.items():
+        if batch:
+            yield key, batch
+
 def validate_xml(xml_string: str) -> bool:
     """Validate XML format"""
     try:
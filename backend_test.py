@@ -9,6 +9,7 @@ import json
 import uuid
 from datetime import datetime
 import sys
+import time
 
 # Backend URL from environment
 BACKEND_URL = "http://localhost:8001"
@@ -404,8 +405,7 @@ class LibraryTestSuite:
         try:
             response = requests.get(f"{API_BASE}/library/{library_id}/xml/export")
             if response.status_code == 200:
-                xml_data = response.json()
-                xml_string = xml_data.get('xml', '')
+                xml_string = response.text
                 
                 # Verify XML structure
                 has_library_catalog = '<LibraryCatalog' in xml_string
@@ -560,6 +560,550 @@ class LibraryTestSuite:
         except Exception as e:
             self.log_test("Error: Get Non-existent Book", False, f"Exception: {str(e)}")
 
+    def test_bulk_borrow_return(self):
+        """Test 10: Bulk Borrow/Return - Per-Entry Results and Counters"""
+        library_id = "a"
+        suffix = uuid.uuid4().hex[:8]
+
+        try:
+            book_ids = []
+            for i in range(2):
+                response = requests.post(f"{API_BASE}/library/{library_id}/books", json={
+                    "title": f"Bulk Loan Book {i} {suffix}",
+                    "author": "Test Author",
+                    "isbn": f"BULK-{suffix}-{i}",
+                    "genre": "Testing",
+                    "pages": 100,
+                    "publisher": "Test Press"
+                })
+                book_ids.append(response.json()['book']['id'])
+            response = requests.post(f"{API_BASE}/library/{library_id}/students", json={
+                "name": f"Bulk Borrower {suffix}",
+                "email": f"bulk.{suffix}@student.edu",
+                "phone": "555-0200",
+                "student_id": f"BULK{suffix}",
+                "grade_level": "11"
+            })
+            student_id = response.json()['student']['id']
+            stats_before = requests.get(f"{API_BASE}/library/{library_id}/stats").json()
+        except Exception as e:
+            self.log_test("Bulk Borrow Setup", False, f"Exception: {str(e)}")
+            return
+
+        # Two good entries, the same item twice and an unknown item
+        record_ids = []
+        try:
+            response = requests.post(f"{API_BASE}/library/{library_id}/borrow/bulk", json=[
+                {"person_id": student_id, "item_id": book_ids[0]},
+                {"person_id": student_id, "item_id": book_ids[1]},
+                {"person_id": student_id, "item_id": book_ids[0]},
+                {"person_id": student_id, "item_id": "fake-item-id"}
+            ])
+            result = response.json()
+            statuses = [entry['status'] for entry in result.get('results', [])]
+            errors = [entry.get('error') for entry in result.get('results', [])]
+            record_ids = [entry['record']['id'] for entry in result.get('results', []) if entry['status'] == 'borrowed']
+            success = (response.status_code == 200 and result.get('borrowed') == 2 and result.get('failed') == 2
+                       and statuses == ['borrowed', 'borrowed', 'failed', 'failed']
+                       and errors[2:] == ["Item is not available", "Item not found"])
+            self.log_test("Bulk Borrow Per-Entry Results", success,
+                        f"Borrowed: {result.get('borrowed')}, Failed: {result.get('failed')}, Errors: {errors[2:]}", result)
+
+            stats = requests.get(f"{API_BASE}/library/{library_id}/stats").json()
+            success = (stats['active_borrows'] - stats_before['active_borrows'] == 2
+                       and stats_before['available_books'] - stats['available_books'] == 2)
+            self.log_test("Bulk Borrow Moves Counters", success,
+                        f"active_borrows {stats_before['active_borrows']} -> {stats['active_borrows']}, "
+                        f"available_books {stats_before['available_books']} -> {stats['available_books']}")
+        except Exception as e:
+            self.log_test("Bulk Borrow Per-Entry Results", False, f"Exception: {str(e)}")
+            return
+
+        if len(record_ids) != 2:
+            return
+
+        # Both loans, one of them again and an unknown record
+        try:
+            response = requests.post(f"{API_BASE}/library/{library_id}/return/bulk", json=[
+                {"record_id": record_ids[0]},
+                {"record_id": record_ids[1]},
+                {"record_id": record_ids[0]},
+                {"record_id": "fake-record-id"}
+            ])
+            result = response.json()
+            statuses = [entry['status'] for entry in result.get('results', [])]
+            errors = [entry.get('error') for entry in result.get('results', [])]
+            success = (response.status_code == 200 and result.get('returned') == 2 and result.get('failed') == 2
+                       and statuses == ['returned', 'returned', 'failed', 'failed']
+                       and errors[2:] == ["Item already returned", "Borrow record not found"])
+            self.log_test("Bulk Return Per-Entry Results", success,
+                        f"Returned: {result.get('returned')}, Failed: {result.get('failed')}, Errors: {errors[2:]}", result)
+
+            stats = requests.get(f"{API_BASE}/library/{library_id}/stats").json()
+            available = [requests.get(f"{API_BASE}/library/{library_id}/books/{book_id}").json().get('available') for book_id in book_ids]
+            success = (stats['active_borrows'] == stats_before['active_borrows']
+                       and stats['available_books'] == stats_before['available_books'] and all(available))
+            self.log_test("Bulk Return Restores Counters", success,
+                        f"active_borrows: {stats['active_borrows']}, available_books: {stats['available_books']}, "
+                        f"items available: {available}")
+        except Exception as e:
+            self.log_test("Bulk Return Per-Entry Results", False, f"Exception: {str(e)}")
+
+    def test_bulk_create(self):
+        """Test 11: Bulk Create/Upsert - Row Errors and Counters"""
+        library_id = "a"
+        suffix = uuid.uuid4().hex[:8]
+        rows = [
+            {
+                "id": f"bulk-book-{suffix}-{i}",
+                "title": f"Bulk Created Book {i} {suffix}",
+                "author": "Test Author",
+                "isbn": f"BULKNEW-{suffix}-{i}",
+                "genre": "Testing",
+                "pages": 120,
+                "publisher": "Test Press"
+            }
+            for i in range(2)
+        ]
+
+        # A row missing required fields is reported by index; the rest are written
+        try:
+            stats_before = requests.get(f"{API_BASE}/library/{library_id}/stats").json()
+            response = requests.post(f"{API_BASE}/library/{library_id}/books/bulk",
+                                   json=[rows[0], {"title": "Incomplete Book"}, rows[1]])
+            result = response.json()
+            stats = requests.get(f"{API_BASE}/library/{library_id}/stats").json()
+            success = (response.status_code == 200 and result.get('inserted') == 2 and result.get('failed') == 1
+                       and [error['index'] for error in result.get('errors', [])] == [1]
+                       and stats['total_books'] - stats_before['total_books'] == 2)
+            self.log_test("Bulk Create Books", success,
+                        f"Inserted: {result.get('inserted')}, Failed: {result.get('failed')}, "
+                        f"total_books {stats_before['total_books']} -> {stats['total_books']}", result)
+        except Exception as e:
+            self.log_test("Bulk Create Books", False, f"Exception: {str(e)}")
+            return
+
+        # Upserting an existing id updates it in place
+        try:
+            renamed = {**rows[0], "title": f"Bulk Renamed Book {suffix}"}
+            response = requests.post(f"{API_BASE}/library/{library_id}/books/bulk",
+                                   params={"upsert": "true"}, json=[renamed])
+            result = response.json()
+            book = requests.get(f"{API_BASE}/library/{library_id}/books/{renamed['id']}").json()
+            stats_after = requests.get(f"{API_BASE}/library/{library_id}/stats").json()
+            success = (response.status_code == 200 and result.get('inserted') == 0 and result.get('updated') == 1
+                       and book.get('title') == renamed['title'] and stats_after['total_books'] == stats['total_books'])
+            self.log_test("Bulk Upsert Books", success,
+                        f"Inserted: {result.get('inserted')}, Updated: {result.get('updated')}, Title: {book.get('title')}", result)
+        except Exception as e:
+            self.log_test("Bulk Upsert Books", False, f"Exception: {str(e)}")
+
+    def wait_for_job(self, job_id, timeout=30):
+        """Poll a background job until it finishes or the timeout passes"""
+        deadline = time.time() + timeout
+        while True:
+            job = requests.get(f"{API_BASE}/jobs/{job_id}").json()['job']
+            if job['status'] in ('completed', 'failed', 'cancelled') or time.time() > deadline:
+                return job
+            time.sleep(0.2)
+
+    def test_background_jobs(self):
+        """Test 12: Background Import Jobs - Completion and Cancellation"""
+        # Import Library A's export into Library B as a job
+        try:
+            xml_bytes = requests.get(f"{API_BASE}/library/a/xml/export").content
+            response = requests.post(f"{API_BASE}/library/b/xml/import/jobs",
+                                   files={"file": ("library_a.xml", xml_bytes)})
+            job = self.wait_for_job(response.json()['job']['id'])
+            imported = job.get('result', {}).get('imported', {})
+            success = response.status_code == 200 and job['status'] == 'completed' and imported.get('books', 0) > 0
+            self.log_test("Import Job Completes", success,
+                        f"Status: {job['status']}, Imported: {imported}", job)
+        except Exception as e:
+            self.log_test("Import Job Completes", False, f"Exception: {str(e)}")
+
+        # A one-record-per-batch import of a large file is still running when the cancel lands
+        try:
+            suffix = uuid.uuid4().hex[:8]
+            library_id = f"jobs_{suffix}"
+            requests.post(f"{API_BASE}/libraries", json={"id": library_id, "name": "Job Test Library"})
+            books = "".join(
+                f"<Book type=\"Testing\"><ID>job-{suffix}-{i}</ID><Title>Job Book {i}</Title><Author>Test Author</Author>"
+                f"<ISBN>JOB-{i}</ISBN><Available>true</Available><Pages>100</Pages><Publisher>Test Press</Publisher></Book>"
+                for i in range(2000)
+            )
+            xml_string = f"<LibraryCatalog><Books>{books}</Books><Magazines></Magazines><Students></Students><Teachers></Teachers></LibraryCatalog>"
+            submitted = requests.post(f"{API_BASE}/library/{library_id}/xml/import/jobs", params={"batch_size": 1},
+                                    files={"file": ("large.xml", xml_string.encode())}).json()['job']
+            response = requests.post(f"{API_BASE}/jobs/{submitted['id']}/cancel")
+            job = self.wait_for_job(submitted['id'])
+            success = response.status_code == 200 and job['status'] == 'cancelled' and job['processed'] < 2000
+            self.log_test("Cancelled Job Ends Cancelled", success,
+                        f"Status: {job['status']}, Processed: {job['processed']} of 2000", job)
+        except Exception as e:
+            self.log_test("Cancelled Job Ends Cancelled", False, f"Exception: {str(e)}")
+
+        try:
+            response = requests.get(f"{API_BASE}/jobs/fake-job-id")
+            self.log_test("Error: Get Non-existent Job", response.status_code == 404,
+                        f"Status: {response.status_code} (Expected 404)")
+        except Exception as e:
+            self.log_test("Error: Get Non-existent Job", False, f"Exception: {str(e)}")
+
+    def test_delta_sync(self):
+        """Test 13: Delta Sync - Only Changes Are Copied, Deletes Propagate"""
+        suffix = uuid.uuid4().hex[:8]
+        source, target = f"src_{suffix}", f"dst_{suffix}"
+        sync_data = {"source": source, "target": target}
+
+        try:
+            for library_id in (source, target):
+                requests.post(f"{API_BASE}/libraries", json={"id": library_id, "name": f"Sync Test {library_id}"})
+            book_ids = [
+                requests.post(f"{API_BASE}/library/{source}/books", json={
+                    "title": f"Sync Book {i} {suffix}",
+                    "author": "Test Author",
+                    "isbn": f"SYNC-{suffix}-{i}",
+                    "genre": "Testing",
+                    "pages": 100,
+                    "publisher": "Test Press"
+                }).json()['book']['id']
+                for i in range(2)
+            ]
+            response = requests.post(f"{API_BASE}/library/xml/sync", json=sync_data)
+            synced = response.json().get('synced', {})
+            self.log_test("First Sync Copies Everything", response.status_code == 200 and synced.get('books') == 2,
+                        f"Synced: {synced}")
+        except Exception as e:
+            self.log_test("First Sync Copies Everything", False, f"Exception: {str(e)}")
+            return
+
+        try:
+            response = requests.post(f"{API_BASE}/library/xml/sync", json=sync_data)
+            synced = response.json().get('synced', {})
+            self.log_test("Second Sync Copies Nothing", response.status_code == 200 and sum(synced.values()) == 0,
+                        f"Synced: {synced}")
+        except Exception as e:
+            self.log_test("Second Sync Copies Nothing", False, f"Exception: {str(e)}")
+
+        try:
+            requests.delete(f"{API_BASE}/library/{source}/books/{book_ids[0]}")
+            response = requests.post(f"{API_BASE}/library/xml/sync", json=sync_data)
+            synced = response.json().get('synced', {})
+            deleted_status = requests.get(f"{API_BASE}/library/{target}/books/{book_ids[0]}").status_code
+            kept_status = requests.get(f"{API_BASE}/library/{target}/books/{book_ids[1]}").status_code
+            stats = requests.get(f"{API_BASE}/library/{target}/stats").json()
+            success = (synced.get('deleted') == 1 and synced.get('books') == 0 and deleted_status == 404
+                       and kept_status == 200 and stats['total_books'] == 1)
+            self.log_test("Sync Propagates Deletes", success,
+                        f"Synced: {synced}, Deleted book: {deleted_status}, Kept book: {kept_status}, "
+                        f"Target total_books: {stats['total_books']}")
+        except Exception as e:
+            self.log_test("Sync Propagates Deletes", False, f"Exception: {str(e)}")
+
+    def test_libraries(self):
+        """Test 14: Library Registry - Create, List and Unknown Libraries"""
+        library_id = f"branch_{uuid.uuid4().hex[:8]}"
+
+        try:
+            response = requests.post(f"{API_BASE}/libraries", json={"id": library_id, "name": "Test Branch"})
+            listed = [library['id'] for library in requests.get(f"{API_BASE}/libraries").json().get('libraries', [])]
+            success = response.status_code == 200 and all(lid in listed for lid in ("a", "b", library_id))
+            self.log_test("Create and List Libraries", success,
+                        f"Created: {library_id}, Listed: {len(listed)} libraries")
+        except Exception as e:
+            self.log_test("Create and List Libraries", False, f"Exception: {str(e)}")
+            return
+
+        try:
+            duplicate = requests.post(f"{API_BASE}/libraries", json={"id": library_id})
+            invalid = requests.post(f"{API_BASE}/libraries", json={"id": "Not A Valid Id!"})
+            self.log_test("Error: Duplicate and Invalid Library", duplicate.status_code == 409 and invalid.status_code == 400,
+                        f"Duplicate: {duplicate.status_code} (Expected 409), Invalid: {invalid.status_code} (Expected 400)")
+        except Exception as e:
+            self.log_test("Error: Duplicate and Invalid Library", False, f"Exception: {str(e)}")
+
+        try:
+            response = requests.post(f"{API_BASE}/library/{library_id}/books", json={
+                "title": "Branch Book",
+                "author": "Test Author",
+                "isbn": "BRANCH-1",
+                "genre": "Testing",
+                "pages": 100,
+                "publisher": "Test Press"
+            })
+            stats = requests.get(f"{API_BASE}/library/{library_id}/stats").json()
+            self.log_test("New Library Is Usable", response.status_code == 200 and stats.get('total_books') == 1,
+                        f"Status: {response.status_code}, total_books: {stats.get('total_books')}")
+        except Exception as e:
+            self.log_test("New Library Is Usable", False, f"Exception: {str(e)}")
+
+        try:
+            response = requests.get(f"{API_BASE}/library/no_such_library/books")
+            self.log_test("Error: Unknown Library", response.status_code == 404,
+                        f"Status: {response.status_code} (Expected 404)")
+        except Exception as e:
+            self.log_test("Error: Unknown Library", False, f"Exception: {str(e)}")
+
+    def test_entity_cache(self):
+        """Test 15: Entity Cache - Repeat Reads Hit, Writes Invalidate"""
+        library_id = "a"
+        suffix = uuid.uuid4().hex[:8]
+
+        try:
+            book = requests.post(f"{API_BASE}/library/{library_id}/books", json={
+                "title": f"Cached Book {suffix}",
+                "author": "Test Author",
+                "isbn": f"CACHE-{suffix}",
+                "genre": "Testing",
+                "pages": 100,
+                "publisher": "Test Press"
+            }).json()['book']
+            requests.get(f"{API_BASE}/library/{library_id}/books/{book['id']}")
+            before = requests.get(f"{API_BASE}/admin/entity-cache").json()
+            requests.get(f"{API_BASE}/library/{library_id}/books/{book['id']}")
+            after = requests.get(f"{API_BASE}/admin/entity-cache").json()
+            self.log_test("Entity Cache Hit", after['hits'] == before['hits'] + 1,
+                        f"Hits {before['hits']} -> {after['hits']}, Size: {after['size']}")
+        except Exception as e:
+            self.log_test("Entity Cache Hit", False, f"Exception: {str(e)}")
+            return
+
+        try:
+            renamed = {**book, "title": f"Renamed Cached Book {suffix}"}
+            requests.put(f"{API_BASE}/library/{library_id}/books/{book['id']}", json=renamed)
+            title = requests.get(f"{API_BASE}/library/{library_id}/books/{book['id']}").json().get('title')
+            self.log_test("Entity Cache Invalidated on Update", title == renamed['title'],
+                        f"Title after update: {title}")
+        except Exception as e:
+            self.log_test("Entity Cache Invalidated on Update", False, f"Exception: {str(e)}")
+
+        try:
+            requests.delete(f"{API_BASE}/library/{library_id}/books/{book['id']}")
+            response = requests.get(f"{API_BASE}/library/{library_id}/books/{book['id']}")
+            self.log_test("Entity Cache Invalidated on Delete", response.status_code == 404,
+                        f"Status after delete: {response.status_code} (Expected 404)")
+        except Exception as e:
+            self.log_test("Entity Cache Invalidated on Delete", False, f"Exception: {str(e)}")
+
+    def test_statistics_consistency(self):
+        """Test 16: Maintained Statistics Match a Full Recount"""
+        library_id = f"stats_{uuid.uuid4().hex[:8]}"
+
+        try:
+            requests.post(f"{API_BASE}/libraries", json={"id": library_id, "name": "Stats Test Library"})
+            book_ids = [
+                requests.post(f"{API_BASE}/library/{library_id}/books", json={
+                    "title": f"Counted Book {i}",
+                    "author": "Test Author",
+                    "isbn": f"STATS-{i}",
+                    "genre": "Testing",
+                    "pages": 100,
+                    "publisher": "Test Press"
+                }).json()['book']['id']
+                for i in range(3)
+            ]
+            student_id = requests.post(f"{API_BASE}/library/{library_id}/students", json={
+                "name": "Counted Student",
+                "email": "counted@student.edu",
+                "phone": "555-0300",
+                "student_id": "STATS1",
+                "grade_level": "12"
+            }).json()['student']['id']
+
+            # Borrow two, return one, delete a book nobody holds
+            records = [
+                requests.post(f"{API_BASE}/library/{library_id}/borrow",
+                            json={"person_id": student_id, "item_id": book_id}).json()['record']['id']
+                for book_id in book_ids[:2]
+            ]
+            requests.post(f"{API_BASE}/library/{library_id}/return", json={"record_id": records[0]})
+            requests.delete(f"{API_BASE}/library/{library_id}/books/{book_ids[2]}")
+
+            stats = requests.get(f"{API_BASE}/library/{library_id}/stats").json()
+            recount = requests.post(f"{API_BASE}/admin/library/{library_id}/stats/reconcile").json()['stats']
+            success = stats == recount and stats['total_books'] == 2 and stats['available_books'] == 1 and stats['active_borrows'] == 1
+            self.log_test("Statistics Match Recount", success,
+                        f"Maintained: {stats}, Recount: {recount}")
+        except Exception as e:
+            self.log_test("Statistics Match Recount", False, f"Exception: {str(e)}")
+
+    def test_cursor_pagination(self):
+        """Test 17: Cursor Pagination - Every Record Once, Bad Cursors Rejected"""
+        library_id = f"paging_{uuid.uuid4().hex[:8]}"
+
+        try:
+            requests.post(f"{API_BASE}/libraries", json={"id": library_id, "name": "Paging Test Library"})
+            created = [
+                requests.post(f"{API_BASE}/library/{library_id}/books", json={
+                    "title": f"Paged Book {i}",
+                    "author": "Test Author",
+                    "isbn": f"PAGE-{i}",
+                    "genre": "Testing",
+                    "pages": 100,
+                    "publisher": "Test Press"
+                }).json()['book']['id']
+                for i in range(3)
+            ]
+
+            seen, cursor, pages = [], None, 0
+            while pages <= len(created):
+                params = {"limit": 1, **({"cursor": cursor} if cursor else {})}
+                page = requests.get(f"{API_BASE}/library/{library_id}/books", params=params).json()
+                seen.extend(book['id'] for book in page['books'])
+                pages += 1
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+            success = cursor is None and len(seen) == len(set(seen)) and sorted(seen) == sorted(created)
+            self.log_test("Cursor Pagination", success,
+                        f"{len(seen)} books over {pages} pages of 1, {len(created)} created")
+        except Exception as e:
+            self.log_test("Cursor Pagination", False, f"Exception: {str(e)}")
+
+        try:
+            response = requests.get(f"{API_BASE}/library/{library_id}/books", params={"cursor": "not-a-cursor"})
+            self.log_test("Error: Invalid Cursor", response.status_code == 400,
+                        f"Status: {response.status_code} (Expected 400)")
+        except Exception as e:
+            self.log_test("Error: Invalid Cursor", False, f"Exception: {str(e)}")
+
+    def test_ndjson_streaming(self):
+        """Test 18: NDJSON Listing - One JSON Object per Line"""
+        library_id = "a"
+
+        try:
+            response = requests.get(f"{API_BASE}/library/{library_id}/books",
+                                  headers={"Accept": "application/x-ndjson"})
+            lines = [line for line in response.text.split("\n") if line]
+            books = [json.loads(line) for line in lines]
+            ids = [book.get('id') for book in books]
+            success = (response.status_code == 200
+                      and response.headers.get('content-type', '').startswith("application/x-ndjson")
+                      and len(books) > 0 and all(isinstance(book, dict) for book in books)
+                      and None not in ids and len(ids) == len(set(ids)))
+            self.log_test("NDJSON Book Listing", success,
+                        f"Status: {response.status_code}, {len(books)} objects, one per line")
+        except Exception as e:
+            self.log_test("NDJSON Book Listing", False, f"Exception: {str(e)}")
+
+    def test_field_selection(self):
+        """Test 19: Field Selection - Only Requested Fields, Unknown Fields Rejected"""
+        library_id = "a"
+
+        try:
+            books = requests.get(f"{API_BASE}/library/{library_id}/books",
+                               params={"fields": "title,available"}).json()['books']
+            key_sets = {tuple(sorted(book)) for book in books}
+            success = len(books) > 0 and key_sets == {('available', 'title')}
+            self.log_test("Field Selection: Book List", success,
+                        f"Keys returned: {sorted(key_sets)}")
+        except Exception as e:
+            self.log_test("Field Selection: Book List", False, f"Exception: {str(e)}")
+
+        try:
+            response = requests.get(f"{API_BASE}/library/{library_id}/books",
+                                  params={"fields": "title,no_such_field"})
+            self.log_test("Error: Unknown Field", response.status_code == 400,
+                        f"Status: {response.status_code} (Expected 400)")
+        except Exception as e:
+            self.log_test("Error: Unknown Field", False, f"Exception: {str(e)}")
+
+    def test_search_ranking(self):
+        """Test 20: Search Ranking and Per-Type Paging"""
+        library_id = f"search_{uuid.uuid4().hex[:8]}"
+        term = f"zephyr{uuid.uuid4().hex[:6]}"
+
+        try:
+            requests.post(f"{API_BASE}/libraries", json={"id": library_id, "name": "Search Test Library"})
+            # A title match outweighs an author match (text index weights 3 vs 1)
+            title_match = requests.post(f"{API_BASE}/library/{library_id}/books", json={
+                "title": f"The {term} Atlas",
+                "author": "Test Author",
+                "isbn": "RANK-1",
+                "genre": "Testing",
+                "pages": 100,
+                "publisher": "Test Press"
+            }).json()['book']['id']
+            author_match = requests.post(f"{API_BASE}/library/{library_id}/books", json={
+                "title": "Plain Title",
+                "author": f"Ann {term}",
+                "isbn": "RANK-2",
+                "genre": "Testing",
+                "pages": 100,
+                "publisher": "Test Press"
+            }).json()['book']['id']
+
+            results = requests.get(f"{API_BASE}/library/{library_id}/search", params={"query": term}).json()
+            ranked = [book['id'] for book in results['books']]
+            self.log_test("Search Ranking", ranked == [title_match, author_match],
+                        f"Ranked: {ranked}, timed out: {results.get('timed_out')}")
+        except Exception as e:
+            self.log_test("Search Ranking", False, f"Exception: {str(e)}")
+            return
+
+        try:
+            pages = [
+                requests.get(f"{API_BASE}/library/{library_id}/search",
+                           params={"query": term, "limit": 1, "page": page}).json()
+                for page in (1, 2, 3)
+            ]
+            walked = [[book['id'] for book in page['books']] for page in pages]
+            success = walked == [[title_match], [author_match], []] and [page['page'] for page in pages] == [1, 2, 3]
+            self.log_test("Search Limit and Page", success,
+                        f"Books per page with limit=1: {walked}")
+        except Exception as e:
+            self.log_test("Search Limit and Page", False, f"Exception: {str(e)}")
+
+    def test_autocomplete(self):
+        """Test 21: Autocomplete - New Titles Appear, Deleted Ones Drop Out"""
+        library_id = "a"
+        title = f"Xylograph {uuid.uuid4().hex[:8]}"
+
+        def suggested(book_id):
+            suggestions = requests.get(f"{API_BASE}/library/{library_id}/autocomplete",
+                                     params={"prefix": title}).json()['suggestions']
+            return any(suggestion['id'] == book_id for suggestion in suggestions)
+
+        try:
+            book_id = requests.post(f"{API_BASE}/library/{library_id}/books", json={
+                "title": title,
+                "author": "Test Author",
+                "isbn": "AUTO-1",
+                "genre": "Testing",
+                "pages": 100,
+                "publisher": "Test Press"
+            }).json()['book']['id']
+            self.log_test("Autocomplete After Create", suggested(book_id),
+                        f"Prefix '{title}' suggests the new book")
+        except Exception as e:
+            self.log_test("Autocomplete After Create", False, f"Exception: {str(e)}")
+            return
+
+        try:
+            requests.delete(f"{API_BASE}/library/{library_id}/books/{book_id}")
+            self.log_test("Autocomplete After Delete", not suggested(book_id),
+                        f"Prefix '{title}' no longer suggests the deleted book")
+        except Exception as e:
+            self.log_test("Autocomplete After Delete", False, f"Exception: {str(e)}")
+
+    def test_overdue_sweeper(self):
+        """Test 22: Overdue Sweeper Metrics Move After a Sweep"""
+        try:
+            before = requests.get(f"{API_BASE}/admin/overdue-sweeper").json()
+            response = requests.post(f"{API_BASE}/admin/overdue-sweeper/run")
+            after = requests.get(f"{API_BASE}/admin/overdue-sweeper").json()
+            success = (response.status_code == 200
+                      and after['runs'] >= before['runs'] + 1
+                      and after['last_run'] != before['last_run']
+                      and after['last_duration_ms'] is not None
+                      and 'a' in after['last_transitioned']
+                      and after['total_transitioned'] >= before['total_transitioned'] + sum(after['last_transitioned'].values()))
+            self.log_test("Overdue Sweeper Metrics", success,
+                        f"Runs {before['runs']} -> {after['runs']}, Transitioned: {after['last_transitioned']}")
+        except Exception as e:
+            self.log_test("Overdue Sweeper Metrics", False, f"Exception: {str(e)}")
+
     def run_all_tests(self):
         """Run all test suites"""
         print("=" * 80)
@@ -577,6 +1121,19 @@ class LibraryTestSuite:
         self.test_search_functionality()
         self.test_statistics()
         self.test_error_handling()
+        self.test_bulk_borrow_return()
+        self.test_bulk_create()
+        self.test_background_jobs()
+        self.test_delta_sync()
+        self.test_libraries()
+        self.test_entity_cache()
+        self.test_statistics_consistency()
+        self.test_cursor_pagination()
+        self.test_ndjson_streaming()
+        self.test_field_selection()
+        self.test_search_ranking()
+        self.test_autocomplete()
+        self.test_overdue_sweeper()
         
         # Summary
         print("=" * 80)
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Performance Benchmarks - Library Management System
+Runs against a live backend; run once on the old build and once on the new one to compare
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BACKEND_URL = "http://localhost:8001"
+API_BASE = f"{BACKEND_URL}/api"
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(name, latencies, elapsed):
+    """Print a latency summary in milliseconds"""
+    ms = [latency * 1000 for latency in latencies]
+    print(f"=== {name} ===")
+    print(f"  Requests:   {len(ms)} in {elapsed:.2f}s ({len(ms) / elapsed:.0f} req/s)")
+    print(f"  p50:        {percentile(ms, 50):.1f} ms")
+    print(f"  p95:        {percentile(ms, 95):.1f} ms")
+    print(f"  p99:        {percentile(ms, 99):.1f} ms")
+    print(f"  max:        {max(ms):.1f} ms")
+    print(f"  mean:       {statistics.mean(ms):.1f} ms")
+    print()
+
+
+def bench_concurrent_reads(library_id="a", clients=200, requests_per_client=20):
+    """p99 latency of a mixed read workload under many concurrent clients"""
+    paths = [
+        f"/library/{library_id}/books",
+        f"/library/{library_id}/students",
+        f"/library/{library_id}/borrow-records",
+        f"/library/{library_id}/stats",
+        f"/library/{library_id}/search?query=the",
+    ]
+
+    def client(worker):
+        session = requests.Session()
+        latencies = []
+        for i in range(requests_per_client):
+            path = paths[(worker + i) % len(paths)]
+            start = time.perf_counter()
+            session.get(f"{API_BASE}{path}")
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - start
+
+    report(f"Concurrent reads ({clients} clients)", [l for r in results for l in r], elapsed)
+
+
+def bench_ndjson_stream(library_id="a", collection="books"):
+    """Time-to-first-byte and total time of a full NDJSON export of one collection"""
+    start = time.perf_counter()
+    response = requests.get(f"{API_BASE}/library/{library_id}/{collection}",
+                            headers={"Accept": "application/x-ndjson"}, stream=True)
+    lines = 0
+    first_byte = None
+    for chunk in response.iter_content(chunk_size=65536):
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        lines += chunk.count(b"\n")
+    elapsed = time.perf_counter() - start
+
+    print(f"=== NDJSON stream ({collection}) ===")
+    print(f"  Records:    {lines}")
+    print(f"  TTFB:       {(first_byte or elapsed) * 1000:.1f} ms")
+    print(f"  Total:      {elapsed:.2f}s")
+    print()
+
+
+WORDS = ["history", "science", "python", "garden", "ocean", "design", "music", "theory",
+         "modern", "ancient", "data", "journey", "art", "systems", "poetry", "economics"]
+
+
+def seed_books(library_id="a", count=500_000, batch=10_000):
+    """Bulk-insert synthetic books straight into Mongo (isbn BENCH-*) for the large-catalog runs"""
+    from pymongo import MongoClient
+
+    client = MongoClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017/"))
+    books = client.library_management[f"library_{library_id}_books"]
+    rng = random.Random(42)
+    for offset in range(0, count, batch):
+        books.insert_many([
+            {
+                "id": str(uuid.uuid4()),
+                "title": " ".join(rng.choices(WORDS, k=4)).title(),
+                "author": f"Author {rng.randrange(5000)}",
+                "isbn": f"BENCH-{offset + i}",
+                "available": True,
+                "item_type": "book",
+                "genre": "Benchmark",
+                "pages": rng.randrange(50, 900),
+                "publisher": "Benchmark Press",
+            }
+            for i in range(min(batch, count - offset))
+        ], ordered=False)
+    print(f"Seeded {count} books into library {library_id.upper()}")
+    print()
+
+
+def bench_search(library_id="a", rounds=50):
+    """Latency of search_library for single-word queries (seed 500k books first for the large-catalog numbers)"""
+    session = requests.Session()
+    latencies = []
+    start = time.perf_counter()
+    for i in range(rounds):
+        query = WORDS[i % len(WORDS)]
+        t0 = time.perf_counter()
+        session.get(f"{API_BASE}/library/{library_id}/search", params={"query": query})
+        latencies.append(time.perf_counter() - t0)
+    report("Search", latencies, time.perf_counter() - start)
+
+
+def bench_autocomplete(library_id="a", rounds=2000):
+    """Latency of type-ahead lookups for 1-4 character prefixes"""
+    session = requests.Session()
+    rng = random.Random(7)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        prefix = rng.choice(WORDS)[:rng.randint(1, 4)]
+        t0 = time.perf_counter()
+        session.get(f"{API_BASE}/library/{library_id}/autocomplete", params={"prefix": prefix})
+        latencies.append(time.perf_counter() - t0)
+    report("Autocomplete", latencies, time.perf_counter() - start)
+
+
+def bench_borrow_contention(library_id="a", items=20, contenders=25):
+    """Many people race to borrow the same items; exactly one borrow per item may succeed"""
+    session = requests.Session()
+    people = []
+    for i in range(contenders):
+        response = session.post(f"{API_BASE}/library/{library_id}/teachers", json={
+            "name": f"Bench Teacher {i}", "email": f"bench{i}@example.com", "phone": "000",
+            "teacher_id": f"BENCH-T{i}", "department": "Benchmark",
+        })
+        people.append(response.json()["teacher"]["id"])
+
+    attempts = []
+    for i in range(items):
+        response = session.post(f"{API_BASE}/library/{library_id}/books", json={
+            "title": f"Contended Book {i}", "author": "Bench", "isbn": f"BENCH-C{i}",
+            "genre": "Benchmark", "pages": 1, "publisher": "Benchmark Press",
+        })
+        item_id = response.json()["book"]["id"]
+        attempts.extend((person_id, item_id) for person_id in people)
+
+    def attempt(pair):
+        person_id, item_id = pair
+        start = time.perf_counter()
+        response = requests.post(f"{API_BASE}/library/{library_id}/borrow",
+                                 json={"person_id": person_id, "item_id": item_id})
+        return item_id, response.status_code, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=contenders) as pool:
+        results = list(pool.map(attempt, attempts))
+    elapsed = time.perf_counter() - start
+
+    wins = {}
+    for item_id, status, _ in results:
+        if status == 200:
+            wins[item_id] = wins.get(item_id, 0) + 1
+    double_borrowed = sum(1 for count in wins.values() if count > 1)
+
+    report(f"Borrow contention ({contenders} contenders x {items} items)",
+           [latency for _, _, latency in results], elapsed)
+    print(f"  Items borrowed:        {len(wins)} / {items}")
+    print(f"  Items double-borrowed: {double_borrowed} (must be 0)")
+    print()
+
+
+def bench_bulk_borrow(library_id="a", total=1000, batch_sizes=(1, 10, 100, 1000)):
+    """Borrow/return throughput through the bulk endpoints at several batch sizes"""
+    session = requests.Session()
+    teacher = session.post(f"{API_BASE}/library/{library_id}/teachers", json={
+        "name": "Bench Bulk Teacher", "email": "bulk@example.com", "phone": "000",
+        "teacher_id": "BENCH-BULK", "department": "Benchmark", "max_borrow_limit": total,
+    }).json()["teacher"]
+    item_ids = [
+        session.post(f"{API_BASE}/library/{library_id}/books", json={
+            "title": f"Bulk Book {i}", "author": "Bench", "isbn": f"BENCH-B{i}",
+            "genre": "Benchmark", "pages": 1, "publisher": "Benchmark Press",
+        }).json()["book"]["id"]
+        for i in range(total)
+    ]
+
+    print("=== Bulk borrow/return ===")
+    for size in batch_sizes:
+        record_ids = []
+        start = time.perf_counter()
+        for offset in range(0, total, size):
+            response = session.post(f"{API_BASE}/library/{library_id}/borrow/bulk", json=[
+                {"person_id": teacher["id"], "item_id": item_id} for item_id in item_ids[offset:offset + size]
+            ])
+            record_ids.extend(r["record"]["id"] for r in response.json()["results"] if r["status"] == "borrowed")
+        borrow_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for offset in range(0, len(record_ids), size):
+            session.post(f"{API_BASE}/library/{library_id}/return/bulk", json=[
+                {"record_id": record_id} for record_id in record_ids[offset:offset + size]
+            ])
+        return_elapsed = time.perf_counter() - start
+
+        print(f"  batch {size:>5}: borrow {len(record_ids) / borrow_elapsed:8.0f}/s   "
+              f"return {len(record_ids) / return_elapsed:8.0f}/s")
+    print()
+
+
+def bench_xml_schema(records=100_000):
+    """In-process XML export and import of a synthetic catalog; needs no running backend"""
+    import io
+    import sys
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    from xml_utils import export_to_xml, import_from_xml, iter_xml_batches
+
+    rng = random.Random(42)
+    data = {"books": [
+        {
+            "id": str(uuid.uuid4()),
+            "title": " ".join(rng.choices(WORDS, k=4)).title(),
+            "author": f"Author {rng.randrange(5000)}",
+            "isbn": f"BENCH-{i}",
+            "available": rng.random() < 0.8,
+            "genre": "Benchmark",
+            "pages": rng.randrange(50, 900),
+            "publisher": "Benchmark Press",
+        }
+        for i in range(records)
+    ], "magazines": [], "students": [], "teachers": []}
+
+    start = time.perf_counter()
+    xml = export_to_xml("a", data)
+    export_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    imported = import_from_xml(xml)
+    import_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    streamed = sum(len(batch) for _, batch in iter_xml_batches(io.BytesIO(xml.encode("utf-8")), 1000))
+    stream_elapsed = time.perf_counter() - start
+
+    print(f"=== XML schema ({records} books, {len(xml) / 1e6:.1f} MB) ===")
+    print(f"  export_to_xml:    {export_elapsed:.2f}s ({records / export_elapsed:.0f} records/s)")
+    print(f"  import_from_xml:  {import_elapsed:.2f}s ({len(imported['books']) / import_elapsed:.0f} records/s)")
+    print(f"  iter_xml_batches: {stream_elapsed:.2f}s ({streamed / stream_elapsed:.0f} records/s)")
+    print()
+
+
+def bench_import_time(runs=5):
+    """Cold import of the backend (python -X importtime -c "import server"); needs no running backend"""
+    import subprocess
+    import sys
+    backend = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+    totals = []
+    modules = {}
+    for _ in range(runs):
+        stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"], cwd=backend,
+                                capture_output=True, text=True, check=True).stderr
+        # "import time: <self us> | <cumulative us> | <name>", the name indented two spaces per nesting level
+        for line in stderr.splitlines()[1:]:
+            _, cumulative_us, name = line.split("|")
+            if name == " server":
+                totals.append(int(cumulative_us) / 1e6)
+            elif name.startswith("   ") and not name.startswith("     "):
+                modules.setdefault(name.strip(), []).append(int(cumulative_us) / 1e6)
+
+    print(f"=== Backend import time ({runs} runs) ===")
+    print(f"  import server:    median {statistics.median(totals) * 1000:.0f} ms, min {min(totals) * 1000:.0f} ms")
+    print("  slowest direct imports (median):")
+    for name, seconds in sorted(modules.items(), key=lambda item: -statistics.median(item[1]))[:10]:
+        print(f"    {name:<24} {statistics.median(seconds) * 1000:.1f} ms")
+    print()
+
+
+BENCHMARKS = {
+    "concurrent-reads": bench_concurrent_reads,
+    "ndjson-stream": bench_ndjson_stream,
+    "search": bench_search,
+    "autocomplete": bench_autocomplete,
+    "borrow-contention": bench_borrow_contention,
+    "bulk-borrow": bench_bulk_borrow,
+    "xml-schema": bench_xml_schema,
+    "import-time": bench_import_time,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=0, help="insert this many synthetic books first")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_books(count=args.seed)
+
+    print(f"Backend URL: {BACKEND_URL}")
+    print()
+    for name in args.benchmarks:
+        BENCHMARKS[name]()
@@ -78,7 +78,7 @@ def test_key_endpoints():
     try:
         response = requests.get(f"{API_BASE}/library/a/xml/export")
         if response.status_code == 200:
-            xml_data = response.json().get('xml', '')
+            xml_data = response.text
             xml_valid = '<LibraryCatalog' in xml_data and '</LibraryCatalog>' in xml_data
             results.append(("XML Export", xml_valid))
         else:
@@ -3,6 +3,15 @@ import axios from 'axios';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 
+// List endpoints return one page at a time plus a next_cursor for the rest
+const LISTS = {
+  books: { path: 'books', key: 'books', dataKey: 'books' },
+  magazines: { path: 'magazines', key: 'magazines', dataKey: 'magazines' },
+  students: { path: 'students', key: 'students', dataKey: 'students' },
+  teachers: { path: 'teachers', key: 'teachers', dataKey: 'teachers' },
+  records: { path: 'borrow-records', key: 'records', dataKey: 'borrowRecords' }
+};
+
 const LibraryDashboard = ({ libraryId, refreshTrigger }) => {
   const [activeTab, setActiveTab] = useState('books');
   const [data, setData] = useState({
@@ -13,6 +22,7 @@ const LibraryDashboard = ({ libraryId, refreshTrigger }) => {
     borrowRecords: [],
     stats: {}
   });
+  const [cursors, setCursors] = useState({});
   const [loading, setLoading] = useState(false);
   const [showAddModal, setShowAddModal] = useState(false);
   const [showBorrowModal, setShowBorrowModal] = useState(false);
@@ -43,12 +53,32 @@ const LibraryDashboard = ({ libraryId, refreshTrigger }) => {
         borrowRecords: recordsRes.data.records,
         stats: statsRes.data
       });
+      setCursors({
+        books: booksRes.data.next_cursor,
+        magazines: magazinesRes.data.next_cursor,
+        students: studentsRes.data.next_cursor,
+        teachers: teachersRes.data.next_cursor,
+        records: recordsRes.data.next_cursor
+      });
     } catch (error) {
       console.error('Error fetching data:', error);
     }
     setLoading(false);
   };
 
+  const loadMore = async (tab) => {
+    const list = LISTS[tab];
+    try {
+      const res = await axios.get(`${BACKEND_URL}/api/library/${libraryId}/${list.path}`, {
+        params: { cursor: cursors[tab] }
+      });
+      setData(prev => ({ ...prev, [list.dataKey]: [...prev[list.dataKey], ...res.data[list.key]] }));
+      setCursors(prev => ({ ...prev, [tab]: res.data.next_cursor }));
+    } catch (error) {
+      setMessage({ type: 'error', text: 'Failed to load more' });
+    }
+  };
+
   const handleAdd = async () => {
     try {
       const endpoint = activeTab === 'books' || activeTab === 'magazines' 
@@ -301,6 +331,17 @@ const LibraryDashboard = ({ libraryId, refreshTrigger }) => {
             )}
           </tbody>
         </table>
+        {cursors[activeTab] && (
+          <div className="flex items-center justify-between px-4 py-3 bg-gray-50 text-sm text-gray-600">
+            <span>Showing the first {items.length}; more are available.</span>
+            <button
+              onClick={() => loadMore(activeTab)}
+              className="text-blue-600 hover:text-blue-800 font-semibold"
+            >
+              Load more
+            </button>
+          </div>
+        )}
       </div>
     );
   };
@@ -520,6 +561,11 @@ const LibraryDashboard = ({ libraryId, refreshTrigger }) => {
                 ))}
               </select>
             </div>
+            {['books', 'magazines', 'students', 'teachers'].some(tab => cursors[tab]) && (
+              <p className="text-xs text-gray-500">
+                Only loaded people and items are listed; use "Load more" on their tabs to see the rest.
+              </p>
+            )}
           </div>
 
           <div className="flex space-x-3 mt-6">
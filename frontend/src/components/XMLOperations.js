@@ -13,8 +13,8 @@ const XMLOperations = ({ libraryId, onRefresh }) => {
     setLoading(true);
     setMessage({ type: '', text: '' });
     try {
-      const response = await axios.get(`${BACKEND_URL}/api/library/${libraryId}/xml/export`);
-      setXmlContent(response.data.xml);
+      const response = await axios.get(`${BACKEND_URL}/api/library/${libraryId}/xml/export`, { responseType: 'text' });
+      setXmlContent(response.data);
       setShowXmlModal(true);
       setMessage({ type: 'success', text: 'XML exported successfully!' });
     } catch (error) {
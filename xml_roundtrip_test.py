@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Test XML Round Trip - Export followed by import must give back the same records
+"""
+
+import gzip
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from xml_utils import export_to_xml, import_from_xml
+
+BACKEND_URL = "http://localhost:8001"
+API_BASE = f"{BACKEND_URL}/api"
+
+# Records with the awkward values: markup characters, unicode, empty strings, false flags
+SAMPLE_DATA = {
+    "books": [
+        {"id": "rt-book-1", "title": "Fish & Chips <Vol. 2>", "author": "Zoë \"Z\" O'Neil", "isbn": "978-0",
+         "available": False, "genre": "Cooking", "pages": 321, "publisher": "", "item_type": "book"},
+        {"id": "rt-book-2", "title": "数据结构", "author": "Wang", "isbn": "", "available": True,
+         "genre": "General", "pages": 0, "publisher": "Press", "item_type": "book"},
+    ],
+    "magazines": [
+        {"id": "rt-mag-1", "title": "Tech > Monthly", "author": "Various", "isbn": "M-1", "available": True,
+         "issue_number": "", "publication_month": "März", "item_type": "magazine"},
+    ],
+    "students": [
+        {"id": "rt-student-1", "name": "Ana  Lúcia", "email": "ana@example.com", "phone": "+1 (555) 0100",
+         "student_id": "S-1", "grade_level": "", "max_borrow_limit": 3, "person_type": "student"},
+    ],
+    "teachers": [
+        {"id": "rt-teacher-1", "name": "Dr. Smith & Sons", "email": "smith@example.com", "phone": "",
+         "teacher_id": "T-1", "department": "R&D", "max_borrow_limit": 12, "person_type": "teacher"},
+    ],
+}
+
+def test_schema_roundtrip():
+    """Test that import_from_xml(export_to_xml(data)) reproduces data field for field"""
+    print("=== XML SCHEMA ROUND TRIP ===")
+    restored = import_from_xml(export_to_xml("a", SAMPLE_DATA))
+
+    ok = True
+    for key, records in SAMPLE_DATA.items():
+        if restored[key] == records:
+            print(f"✅ {key}: {len(records)} records identical")
+        else:
+            ok = False
+            print(f"❌ {key}: expected {records}, got {restored[key]}")
+    return ok
+
+def test_api_roundtrip():
+    """Test that a Library A export uploaded into Library B comes back unchanged"""
+    print("=== API EXPORT/IMPORT ROUND TRIP ===")
+    created = {}
+    for key, records in SAMPLE_DATA.items():
+        response = requests.post(f"{API_BASE}/library/a/{key}/bulk", params={"upsert": "true"}, json=records)
+        if response.status_code != 200:
+            print(f"❌ Could not seed {key}: {response.status_code} - {response.text}")
+            return False
+        created[key] = records
+
+    export = requests.get(f"{API_BASE}/library/a/xml/export")
+    upload = requests.post(f"{API_BASE}/library/b/xml/import/upload",
+                           files={"file": ("library_a_export.xml.gz", gzip.compress(export.content))})
+    if upload.status_code != 200:
+        print(f"❌ Upload failed: {upload.status_code} - {upload.text}")
+        return False
+    print(f"Imported: {upload.json()['imported']}")
+
+    ok = True
+    for key, records in created.items():
+        for record in records:
+            response = requests.get(f"{API_BASE}/library/b/{key}/{record['id']}")
+            stored = response.json() if response.status_code == 200 else {}
+            mismatched = [field for field, value in record.items() if stored.get(field) != value]
+            if mismatched:
+                ok = False
+                print(f"❌ {key} {record['id']}: fields differ: {mismatched}")
+            else:
+                print(f"✅ {key} {record['id']} survived the round trip")
+    return ok
+
+if __name__ == "__main__":
+    print("Testing XML Export/Import Fidelity")
+    print("=" * 60)
+
+    schema_ok = test_schema_roundtrip()
+    print()
+    api_ok = test_api_roundtrip()
+
+    print()
+    print("=" * 60)
+    print("SUMMARY:")
+    print(f"✅ Schema Round Trip: {schema_ok}")
+    print(f"✅ API Round Trip: {api_ok}")